@@ -37,6 +37,19 @@ q = pl.scan_csv(f_name).filter(pl.col("sepal_length") > 5).groupby("species").ag
 df = q.collect()
 print(df)
 
+"""
+scan_csv still has to parse the whole text file (and infer its schema) 
+on every run before pushdown can drop rows and columns. Ingesting the CSV 
+once into Parquet with row-group statistics lets the same query skip 
+row groups and read only the 3 columns it needs.
+"""
+from learn_polars.datasets import ingest
+
+q = ingest.scan_csv(f_name).filter(pl.col("sepal_length") > 5).groupby("species").agg(pl.col("sepal_width").mean())
+
+df = q.collect()
+print(df)
+
 """
 When to use which:
     In general the lazy API should be preferred unless 
@@ -12,3 +12,19 @@ q = pl.scan_csv(f_name).filter(pl.col("sepal_length") > 5).groupby("species").ag
 
 df = q.collect(streaming=True)
 print(df)
+
+"""
+Not every operator streams: whatever the streaming engine can't run
+(here the `over` window) runs in memory on the whole input. The coverage
+report marks every node of the plan and estimates the peak memory at a
+given input size; streaming.collect refuses plans that won't fit.
+"""
+from learn_polars import streaming
+
+q = pl.scan_csv(f_name).with_columns(pl.col("sepal_width").mean().over("species"))
+print(streaming.coverage(q, n_rows=100_000_000))
+
+try:
+    streaming.collect(q, budget_bytes=4 * 2**30, n_rows=100_000_000)
+except streaming.MemoryBudgetError as e:
+    print(e)
@@ -96,6 +96,17 @@ intermediate_out = weather_list.with_columns(
 )
 print(intermediate_out)
 
+"""
+Both versions run a sub-query per list. Casting the whole list column
+parses every token at once, and list.count_match(None) then counts the
+tokens that didn't parse, so the values and the error count come out of
+a single split:
+"""
+from learn_polars import lists
+
+intermediate_out = lists.parse(weather, "temperatures")
+print(intermediate_out.select("station", "temperatures_values", "temperatures_errors"))
+
 """
 Row-wise computations
 This context is ideal for computing in row orientation.
@@ -166,6 +177,20 @@ shape: (10, 5)
 └────────────┴───────┴───────┴───────┴────────────────────┘
 """
 
+"""
+The list column only exists to be ranked. learn_polars.rowwise
+ranks across the original columns directly, a block of rows at
+a time, and gives one rank column per day:
+"""
+import polars.selectors as cs
+from learn_polars import rowwise
+
+ranks = rowwise.rank(weather_by_day, cs.starts_with("day_"), descending=True, pct=True)
+print(weather_by_day.hstack(ranks.select(pl.all().round(2))))
+
+# which day was the warmest, per station
+print(weather_by_day.hstack(rowwise.argsort(weather_by_day, cs.starts_with("day_"), descending=True).select("arg_0")))
+
 """
 Polars Arrays
 Arrays are a new data type that was recently introduced, 
@@ -192,3 +217,32 @@ out = array_df.select(
     pl.col("Array_2").arr.sum().suffix("_sum"),
 )
 print(out)
+
+"""
+Beyond min/max/sum, the values of an Array column sit in one flat 
+buffer, width by width, so they can be read as a 2-D NumPy array 
+without a copy. learn_polars.arrays uses that view for row-wise 
+vector math: dot products, norms, cosine similarity against a 
+query vector, argmax, and elementwise arithmetic between two 
+Array columns.
+"""
+import numpy as np
+from learn_polars import arrays
+
+embeddings = pl.DataFrame(
+    [
+        pl.Series("doc", ["a", "b", "c"]),
+        arrays.from_numpy("embedding", np.array([[0.1, 0.9, 0.0], [0.8, 0.1, 0.1], [0.4, 0.4, 0.2]])),
+        arrays.from_numpy("bias", np.full((3, 3), 0.05)),
+    ]
+)
+query = np.array([1.0, 0.0, 0.0])
+
+out = embeddings.select(
+    pl.col("doc"),
+    arrays.cosine(pl.col("embedding"), query).alias("similarity"),
+    arrays.norm(pl.col("embedding")).alias("norm"),
+    arrays.argmax(pl.col("embedding")).alias("strongest"),
+    arrays.add(pl.col("embedding"), pl.col("bias")).alias("shifted"),
+)
+print(out.sort("similarity", descending=True))
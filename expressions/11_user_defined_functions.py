@@ -94,3 +94,19 @@ This went horribly wrong, because the map applies the function before we aggrega
 
 So my advice is to never use map in the groupby context unless you know you need it and know what you are doing.
 """
+
+"""
+learn_polars.udfs finds map/apply calls whose function has a native 
+equivalent (shift, cumsum, abs, arithmetic, ...) and replaces them, 
+reporting the Python calls that are left. Build the query on 
+batch.track(df) so it can be rewritten.
+"""
+from learn_polars import batch, udfs
+
+q = batch.track(df).groupby("keys", maintain_order=True).agg(
+    pl.col("values").map(lambda s: s.shift()).alias("shift_map"),
+    pl.col("values").shift().alias("shift_expression"),
+)
+lf, report = udfs.rewrite(q)
+print(report)
+print(lf.collect())
@@ -71,3 +71,20 @@ from polars.selectors import selector_column_names
 
 out = cs.temporal().as_expr().dt.to_string("%Y-%h-%d")
 print(selector_column_names(df, out))
+
+"""
+Every plan resolves its selectors against the schema again, and on frames
+with thousands of columns the set operations take most of the planning.
+learn_polars.selections resolves each selection once per schema, from the
+schema alone, and hands back the names or one pl.col per column:
+"""
+from learn_polars.selections import SelectorCache
+
+cache = SelectorCache()
+selections = cache.bind(df.lazy())
+print(selections.names(cs.numeric() - cs.first()))
+print(selections.names(pl.col("^.*(as|sa).*$")))
+
+out = df.lazy().select(selections.columns(cs.by_name("rn"), ~cs.numeric())).collect()
+print(out)
+print(cache)
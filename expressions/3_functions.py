@@ -37,6 +37,44 @@ df_alias = df.select(
 )
 print(df_alias)
 
+# Mergeable sketches: states per day, merged into weeks without the raw rows
+from learn_polars.sketches import CountMinTopK, HyperLogLog, TDigest
+
+rng = np.random.default_rng(0)
+logs = pl.DataFrame(
+    {
+        "day": pl.date_range(pl.date(2023, 1, 1), pl.date(2023, 1, 28), eager=True).sample(20_000, with_replacement=True, seed=0),
+        "user_id": rng.integers(0, 5_000, 20_000),
+        "latency": rng.lognormal(3, 1, 20_000),
+    }
+).with_columns(pl.col("user_id").cast(pl.Utf8).alias("user"))
+
+hll, digest, top = HyperLogLog(), TDigest(), CountMinTopK(k=3)
+daily = (
+    hll.agg(logs, "day", "user_id")
+    .join(digest.agg(logs, "day", "latency"), on="day")
+    .join(top.agg(logs, "day", "user"), on="day")
+    .sort("day")
+)
+print(daily.head(3))
+
+weekly = daily.groupby_dynamic("day", every="1w").agg(
+    hll.merge_expr("user_id_hll"), digest.merge_expr("latency_tdigest"), top.merge_expr("user_topk")
+)
+print(
+    weekly.select(
+        "day",
+        hll.estimate(weekly["user_id_hll"]).alias("users_approx"),
+        digest.quantile(weekly["latency_tdigest"], 0.99).alias("p99_approx"),
+        top.top(weekly["user_topk"]).alias("top_users"),
+    )
+)
+print(
+    logs.sort("day").groupby_dynamic("day", every="1w").agg(
+        pl.col("user_id").n_unique().alias("users"), pl.col("latency").quantile(0.99).alias("p99")
+    )
+)
+
 # Conditionals
 df_conditional = df.select(
     pl.col("nrs"), pl.when(pl.col("nrs") > 2).then(pl.lit(True)).otherwise(pl.lit(False)).alias("conditional")
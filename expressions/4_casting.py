@@ -49,6 +49,16 @@ except Exception as e:
 out = df.select(pl.col("big_integers").cast(pl.Int8, strict=False))
 print(out)
 
+"""
+optimize_dtypes picks the narrowest lossless type for every column 
+from its min/max (and Float32 round trip, and distinct string count) 
+and reports how much memory that saves.
+"""
+from learn_polars.dtypes import optimize_dtypes
+
+out, report = optimize_dtypes(df)
+print(report)
+
 # Strings
 
 df = pl.DataFrame(
@@ -114,3 +124,16 @@ out = df.select(
     pl.col("string").str.strptime(pl.Datetime, "%Y-%m-%d"),
 )
 print(out)
+
+"""
+temporal.parse detects the format from a sample, parses the column in
+one pass with it, and collects the strings that don't match in a
+quarantine table (with their row number) instead of failing.
+"""
+from learn_polars import temporal
+
+df = pl.DataFrame({"string": ["01/02/2022", "15/02/2022", "not a date", None]})
+result = temporal.parse(df, "string")
+print(result.formats)
+print(result.frame)
+print(result.quarantine)
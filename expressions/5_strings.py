@@ -63,3 +63,46 @@ out = df.with_columns(
     pl.col("text").str.replace_all("a", "-", literal=True).alias("text_replace_all"),
 )
 print(out)
+
+"""
+A Matcher runs several patterns over one column in a single select
+(each is still its own pass over the column, in parallel). It checks the
+patterns up front and runs each one the cheapest exact way: an extract
+whose group follows a literal prefix is matched without the (slow)
+capture group and the prefix is sliced off.
+"""
+from learn_polars.strings import Matcher
+
+df = pl.DataFrame(
+    {
+        "a": [
+            "http://vote.com/ballon_dor?candidate=messi&ref=polars",
+            "http://vote.com/ballon_dor?candidat=jorginho&ref=polars",
+            "http://vote.com/ballon_dor?candidate=ronaldo2&ref=polars",
+        ]
+    }
+)
+matcher = Matcher(
+    contains={"regex": "cat|bit"},
+    extract={"candidate": r"candidate=(\w+)"},
+    extract_all={"extracted_nrs": r"(\d+)"},
+)
+print(matcher)
+out = df.select(matcher.exprs("a"))
+print(out)
+
+"""
+For URLs, urls.split cuts every URL into scheme / host / path / query /
+fragment with literal splits, and query_value looks a parameter up
+without a capture group. query_pairs lists all parameters, which shows
+the `candidat` typo that makes the lookup null.
+"""
+from learn_polars import urls
+
+out = urls.split(df, "a").select(
+    pl.col("a_parts").struct.field("host"),
+    pl.col("a_parts").struct.field("path"),
+    urls.query_value(pl.col("a"), "candidate"),
+)
+print(out)
+print(urls.query_pairs(df, "a"))
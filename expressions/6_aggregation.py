@@ -1,6 +1,12 @@
 import polars as pl
 
-url = "https://theunitedstates.io/congress-legislators/legislators-historical.csv"
+from learn_polars.datasets import fetch
+
+"""
+The legislators CSV (https://theunitedstates.io/congress-legislators/legislators-historical.csv)
+is downloaded once, verified by hash and converted to a typed IPC file,
+so this is a memory-mapped read instead of an HTTP request. It is
+equivalent to:
 
 dtypes = {
     "first_name": pl.Categorical,
@@ -9,12 +15,11 @@ dtypes = {
     "state": pl.Categorical,
     "party": pl.Categorical,
 }
-
-dataset = (
-    pl.read_csv(url, dtypes=dtypes)
-    .with_columns(pl.col("birthday").str.strptime(pl.Date, strict=False))
-    .with_row_count("id")
+pl.read_csv(url, dtypes=dtypes).with_columns(
+    pl.col("birthday").str.strptime(pl.Date, strict=False)
 )
+"""
+dataset = fetch.load("legislators").with_row_count("id")
 print(dataset)
 
 """
@@ -77,6 +82,33 @@ q = (
 df = q.collect()
 print(df)
 
+"""
+A dashboard runs queries like these again on every refresh, recomputing
+the same results until the data changes. result_cache.ResultCache keeps
+them on disk, keyed on the plan and the size and mtime of the files it
+scans, so a refresh only reads them back. The queries have to scan the
+file: a plan over an in-memory frame has nothing to key on.
+"""
+from learn_polars.result_cache import ResultCache
+
+
+def dashboard(lf: pl.LazyFrame) -> list[pl.LazyFrame]:
+    by_name = lf.groupby("first_name").agg(pl.count()).sort("count", descending=True).limit(5)
+    by_state = (
+        lf.groupby("state")
+        .agg((pl.col("party") == "Pro-Administration").sum().alias("pro"))
+        .sort("pro", descending=True)
+        .limit(5)
+    )
+    return [by_name, by_state]
+
+
+cache = ResultCache()
+for refresh in range(3):
+    frames = [cache.collect(q) for q in dashboard(fetch.scan("legislators"))]
+print(cache.stats)
+print(frames[0])
+
 """
 Filtering
 We can also filter the groups. Let's say we want to compute 
@@ -170,3 +202,56 @@ q = (
 
 df = q.collect()
 print(df)
+
+"""
+get_person() is computed three times per group above, once per use. 
+cse.rewrite finds sub-expressions that are used more than once and 
+compute row by row, computes each of them once in a with_columns 
+before the groupby, and reports what it shared and the time saved:
+"""
+from learn_polars import batch, cse
+
+q = (
+    batch.track(dataset.lazy())
+    .sort("birthday", descending=True)
+    .groupby("state")
+    .agg(
+        get_person().first().alias("youngest"),
+        get_person().last().alias("oldest"),
+        get_person().sort().first().alias("alphabetical_first"),
+        avg_birthday("M"),
+        avg_birthday("F"),
+    )
+)
+lf, report = cse.rewrite(q, timed=True)
+print(report)
+print(lf.sort("state").limit(5).collect())
+
+"""
+When the data doesn't fit in memory, external.run_partitioned spills it to
+hash partitions on the group key and runs the same query one partition at
+a time; external.sort is a merge sort over spilled runs. Here the budget
+is a tenth of the data.
+"""
+from learn_polars import external
+
+
+def youngest_and_oldest(lf: pl.LazyFrame) -> pl.LazyFrame:
+    return (
+        lf.sort("birthday", descending=True)
+        .groupby("state")
+        .agg(
+            get_person().first().alias("youngest"),
+            get_person().last().alias("oldest"),
+        )
+    )
+
+
+budget = dataset.estimated_size() // 10
+df, report = external.run_partitioned(dataset, "state", youngest_and_oldest, memory_budget_bytes=budget)
+print(report)
+print(df.sort("state").limit(5))
+
+lf, report = external.sort(dataset, "birthday", memory_budget_bytes=budget, descending=True)
+print(report)
+print(lf.limit(5).collect())
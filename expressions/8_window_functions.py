@@ -1,9 +1,10 @@
 import polars as pl
 
+from learn_polars.datasets import fetch
+
 # then let's load some csv data with information about pokemon
-df = pl.read_csv(
-    "https://gist.githubusercontent.com/ritchie46/cac6b337ea52281aa23c049250a4ff03/raw/89a957ff3919d90e6ef2d34235e6bf22304f3366/pokemon.csv"
-)
+# (downloaded once from the polars user guide gist, then served from a local cache)
+df = fetch.load("pokemon")
 print(df.head())
 
 """
@@ -131,3 +132,50 @@ rows in the original df with the same val for the windowed
 column, then the derived value is mapped across all those
 rows. 
 """
+
+"""
+windows.plan picks the mapping strategy from the expression and from what
+is known about the order of the rows: "explode" only pays off (and only
+gives the rows back in frame order) when every group's rows are next to
+each other, as after df.sort("Type 1"), which sets a sorted flag on the
+column. It warns when "join" would repeat big lists on every row.
+"""
+from learn_polars import windows
+
+fastest = pl.col("Name").sort_by(pl.col("Speed")).head(3)
+print(windows.plan(df, fastest, "Type 1", keep_rows=False))
+print(windows.plan(df.sort("Type 1"), pl.col("Speed").cumsum(), "Type 1"))
+expr, window_plan = windows.over(df, pl.col("Speed").cumsum(), "Type 1")
+print(window_plan)
+print(df.select("Type 1", expr))
+
+"""
+The cached groups of a window only live within one select. A GroupCache
+keeps the group index of a key set for the frame, so independent queries
+grouped by the same keys hash them once; it counts its hits and misses.
+"""
+from learn_polars.groups import GroupCache
+
+cache = GroupCache(df)
+print(cache.groupby("Type 1", pl.col("Attack").mean().alias("avg_attack")))
+print(df.with_columns(cache.over("Type 1", pl.col("Attack").mean().alias("avg_attack_by_type"))))
+print(cache)
+
+"""
+With a huge number of groups, learn_polars.windows evaluates the same
+window expressions on worker processes, one hash partition of `Type 1`
+(the key both windows share) at a time, and puts the rows back in their
+original order. The workers are spawned and import this script again, so
+the call sits behind the __main__ guard.
+"""
+if __name__ == "__main__":
+    with windows.executor(2) as pool:
+        out = windows.select(
+            df,
+            [
+                pl.col("Attack").mean().over("Type 1").alias("avg_attack_by_type"),
+                pl.col("Defense").mean().over(["Type 1", "Type 2"]).alias("avg_defense_by_type_combination"),
+            ],
+            pool=pool,
+        )
+    print(out)
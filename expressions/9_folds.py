@@ -56,6 +56,25 @@ out = df.filter(
 )
 print(out)
 
+"""
+Both folds above call back into Python for every column, and the 
+optimizer can't look inside the lambda. folds.fold recognizes common 
+reductions (sum, product, min/max, all/any, string concat) and builds 
+them from native expressions instead; given the schema it can spell 
+out wildcards like pl.col("*").
+"""
+from learn_polars import folds
+
+out = df.filter(
+    folds.fold(
+        acc=pl.lit(True),
+        function=lambda acc, x: acc & x,
+        exprs=pl.col("*") > 1,
+        schema=df.schema,
+    )
+)
+print(out)
+
 """
 Folds could be used to concatenate string data. 
 However, due to the materialization of intermediate columns,
@@ -0,0 +1,7 @@
+"""
+Helpers built on top of the examples in concepts/ and expressions/.
+
+The example scripts stay as plain, print-driven walkthroughs of the
+Polars user guide; this package holds the reusable pieces that let us
+measure and scale those same patterns.
+"""
@@ -0,0 +1,303 @@
+"""
+Batch execution of related lazy queries with shared prefixes computed once.
+
+expressions/6_aggregation.py runs several pipelines that all start with
+`dataset.lazy()`, most of them followed by the same
+`.sort("birthday", descending=True)` and / or `.groupby("state")`.
+Collected one by one, each query redoes that sort and hash grouping.
+
+Polars can't hand out the sub-plans of a LazyFrame, so the queries are
+built on a recorder instead: `track(frame)` returns a LazyFrame stand-in
+that remembers every method call. `collect_batch` then lays the recorded
+call chains side by side and
+
+* computes each common prefix (same source, same steps) once;
+* merges `groupby(keys).agg(...)` steps on the same keys into a single
+  groupby whose aggregation list is the union of all the queries' aggs
+  (identical aggs are computed once), and gives every query its own
+  columns back;
+* runs the remaining, query-specific tails together with
+  `pl.collect_all`.
+
+    src = batch.track(dataset.lazy())
+    by_state = src.sort("birthday", descending=True).groupby("state").agg(...)
+    by_name = src.groupby("first_name").agg(...).sort("count").limit(5)
+    results, report = batch.collect_batch([by_state, by_name])
+    print(report)
+"""
+from dataclasses import dataclass, field
+from typing import Any
+
+import polars as pl
+
+_GROUPBY_AGG = "groupby.agg"
+
+
+def _expr_key(expr: pl.Expr) -> str | None:
+    """
+    The JSON of `expr`, or None if it can't be serialized: lambdas, opaque
+    functions (`rank`, `list.eval`), and selectors and decimals (which make
+    polars panic).
+    """
+    text = str(expr)
+    if "SELECTOR" in text or "Decimal" in text:
+        return None
+    try:
+        return expr.meta.write_json(None)
+    except Exception:
+        return None
+
+
+def _key(value: Any) -> Any:
+    """Hashable, structural key for a call argument."""
+    if isinstance(value, pl.Expr):
+        # not `str(value)`: every UDF prints as `python_udf()` and every literal Series as `Series`
+        key = _expr_key(value)
+        # an expression without a key is never shared
+        return ("expr", key if key is not None else id(value))
+    if isinstance(value, (list, tuple)):
+        return tuple(_key(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _key(v)) for k, v in value.items()))
+    if isinstance(value, (pl.DataFrame, pl.LazyFrame)):
+        return ("frame", id(value))
+    return repr(value)
+
+
+@dataclass(frozen=True)
+class Step:
+    method: str
+    args: tuple
+    kwargs: dict
+    # for groupby.agg: the groupby args; `args` / `kwargs` hold the aggs
+    by: tuple = ()
+    by_kwargs: dict = field(default_factory=dict)
+
+    @property
+    def key(self) -> Any:
+        if self.method == _GROUPBY_AGG:
+            # steps on the same keys share a node, their aggs are merged
+            return (self.method, _key(self.by), _key(self.by_kwargs))
+        return (self.method, _key(self.args), _key(self.kwargs))
+
+    def apply(self, lf: pl.LazyFrame) -> pl.LazyFrame:
+        if self.method == _GROUPBY_AGG:
+            return lf.groupby(*self.by, **self.by_kwargs).agg(*self.args, **self.kwargs)
+        return getattr(lf, self.method)(*self.args, **self.kwargs)
+
+    def __str__(self) -> str:
+        def fmt(args, kwargs):
+            return ", ".join([str(a) for a in args] + [f"{k}={v!r}" for k, v in kwargs.items()])
+
+        if self.method == _GROUPBY_AGG:
+            return f"groupby({fmt(self.by, self.by_kwargs)}).agg(...)"
+        return f"{self.method}({fmt(self.args, self.kwargs)})"
+
+
+class Tracked:
+    """A LazyFrame stand-in that records the calls made on it."""
+
+    def __init__(self, source: pl.LazyFrame, steps: tuple[Step, ...] = ()):
+        self._source = source
+        self._steps = steps
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        attr = getattr(pl.LazyFrame, name)
+        if not callable(attr):
+            # properties like schema / columns / dtypes
+            return getattr(self.lazy(), name)
+
+        def record(*args, **kwargs):
+            return Tracked(self._source, self._steps + (Step(name, args, kwargs),))
+
+        return record
+
+    def groupby(self, *by, **kwargs) -> "_TrackedGroupBy":
+        return _TrackedGroupBy(self, by, kwargs)
+
+    def lazy(self) -> pl.LazyFrame:
+        """The LazyFrame this recording stands for."""
+        lf = self._source
+        for step in self._steps:
+            lf = step.apply(lf)
+        return lf
+
+    def collect(self, **kwargs) -> pl.DataFrame:
+        return self.lazy().collect(**kwargs)
+
+
+class _TrackedGroupBy:
+    def __init__(self, tracked: Tracked, by: tuple, by_kwargs: dict):
+        self._tracked = tracked
+        self._by = by
+        self._by_kwargs = by_kwargs
+
+    def agg(self, *aggs, **named_aggs) -> Tracked:
+        step = Step(_GROUPBY_AGG, aggs, named_aggs, self._by, self._by_kwargs)
+        return Tracked(self._tracked._source, self._tracked._steps + (step,))
+
+    def __getattr__(self, name: str):
+        # other groupby methods (count, mean, ...) are recorded as plain steps
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        def record(*args, **kwargs):
+            step = _GroupByCall(name, args, kwargs, self._by, self._by_kwargs)
+            return Tracked(self._tracked._source, self._tracked._steps + (step,))
+
+        return record
+
+
+@dataclass(frozen=True)
+class _GroupByCall(Step):
+    def apply(self, lf: pl.LazyFrame) -> pl.LazyFrame:
+        return getattr(lf.groupby(*self.by, **self.by_kwargs), self.method)(*self.args, **self.kwargs)
+
+    @property
+    def key(self) -> Any:
+        return ("groupby." + self.method, _key(self.by), _key(self.by_kwargs), _key(self.args), _key(self.kwargs))
+
+
+def track(frame: pl.LazyFrame | pl.DataFrame) -> Tracked:
+    """Start recording queries on `frame`; queries from one `track` share a source."""
+    return Tracked(frame.lazy())
+
+
+@dataclass
+class BatchReport:
+    queries: int = 0
+    # operators that would have run once per query but ran once in total
+    deduplicated_operators: int = 0
+    merged_groupbys: int = 0
+    deduplicated_aggs: int = 0
+    shared: list[str] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        lines = [
+            f"{self.queries} queries, {self.deduplicated_operators} operators deduplicated "
+            f"({self.merged_groupbys} groupbys merged, {self.deduplicated_aggs} duplicate aggs removed)"
+        ]
+        lines += [f"  shared: {s}" for s in self.shared]
+        return "\n".join(lines)
+
+
+def _flatten(exprs: tuple) -> list:
+    out = []
+    for e in exprs:
+        out += _flatten(tuple(e)) if isinstance(e, (list, tuple)) else [pl.col(e) if isinstance(e, str) else e]
+    return out
+
+
+def _output_name(expr: Any) -> str | None:
+    if isinstance(expr, str):
+        return expr
+    if isinstance(expr, pl.Expr) and not expr.meta.has_multiple_outputs():
+        try:
+            return expr.meta.output_name()
+        except Exception:
+            return None
+    return None
+
+
+def _mergeable(step: Step) -> bool:
+    # every key and agg needs a single, known output name
+    if step.kwargs or step.by_kwargs.get("maintain_order"):
+        return False
+    names = [_output_name(e) for e in _flatten(step.by) + _flatten(step.args)]
+    return all(n is not None for n in names) and len(set(names)) == len(names)
+
+
+def _merge_groupbys(
+    lf: pl.LazyFrame,
+    members: list[tuple[int, tuple[Step, ...]]],
+    report: BatchReport,
+) -> list[tuple[int, pl.LazyFrame, tuple[Step, ...]]]:
+    """Run one groupby for all members and hand each its own columns back."""
+    first = members[0][1][0]
+    aliases: dict[Any, str] = {}
+    merged_aggs = []
+    selections = []
+    for idx, steps in members:
+        select = [pl.col(_output_name(k)) for k in _flatten(first.by)]
+        for agg in _flatten(steps[0].args):
+            key = _key(agg)
+            if key not in aliases:
+                aliases[key] = f"__batch_{len(aliases)}"
+                merged_aggs.append(agg.alias(aliases[key]))
+            else:
+                report.deduplicated_aggs += 1
+            select.append(pl.col(aliases[key]).alias(_output_name(agg)))
+        selections.append(select)
+
+    shared = lf.groupby(*first.by, **first.by_kwargs).agg(merged_aggs).collect().lazy()
+    report.merged_groupbys += len(members) - 1
+    report.deduplicated_operators += len(members) - 1
+    report.shared.append(f"{first} with {len(merged_aggs)} aggs for queries {[i for i, _ in members]}")
+    return [(idx, shared.select(select), steps[1:]) for (idx, steps), select in zip(members, selections)]
+
+
+def _plan(
+    lf: pl.LazyFrame,
+    members: list[tuple[int, tuple[Step, ...]]],
+    prefix: list[Step],
+    report: BatchReport,
+) -> list[tuple[int, pl.LazyFrame]]:
+    """Walk the call chains of `members` (which all start at `lf`), sharing work where they agree."""
+    if len(members) == 1:
+        idx, steps = members[0]
+        for step in steps:
+            lf = step.apply(lf)
+        return [(idx, lf)]
+
+    done = [(idx, lf) for idx, steps in members if not steps]
+    branches: dict[Any, list[tuple[int, tuple[Step, ...]]]] = {}
+    for idx, steps in members:
+        if steps:
+            branches.setdefault(steps[0].key, []).append((idx, steps))
+
+    if len(branches) == 1 and not done:
+        # everyone agrees on the next step: keep building the shared prefix lazily
+        (branch,) = branches.values()
+        step = branch[0][1][0]
+        if step.method != _GROUPBY_AGG or len({_key(s[0].args) for _, s in branch}) == 1:
+            report.deduplicated_operators += len(branch) - 1
+            return _plan(step.apply(lf), [(i, s[1:]) for i, s in branch], prefix + [step], report)
+
+    if prefix:
+        # the chains diverge here: compute the shared prefix once
+        lf = lf.collect().lazy()
+        report.shared.append(" -> ".join(str(s) for s in prefix) + f" for queries {sorted(i for i, _ in members)}")
+
+    out = done
+    for branch in branches.values():
+        step = branch[0][1][0]
+        if len(branch) > 1 and step.method == _GROUPBY_AGG and all(_mergeable(s[0]) for _, s in branch):
+            for idx, branch_lf, rest in _merge_groupbys(lf, branch, report):
+                out += _plan(branch_lf, [(idx, rest)], [], report)
+        else:
+            out += _plan(lf, branch, [], report)
+    return out
+
+
+def collect_batch(queries: list[Tracked], **collect_kwargs) -> tuple[list[pl.DataFrame], BatchReport]:
+    """
+    Collect all `queries`, computing shared prefixes once. Returns the
+    results in input order and a report of what was shared.
+    """
+    report = BatchReport(queries=len(queries))
+    by_source: dict[int, list[tuple[int, Tracked]]] = {}
+    for i, q in enumerate(queries):
+        if not isinstance(q, Tracked):
+            raise TypeError(f"query {i} is a {type(q).__name__}; build queries on batch.track(frame)")
+        by_source.setdefault(id(q._source), []).append((i, q))
+
+    tails: list[tuple[int, pl.LazyFrame]] = []
+    for members in by_source.values():
+        source = members[0][1]._source
+        tails += _plan(source, [(i, q._steps) for i, q in members], [], report)
+
+    tails.sort(key=lambda t: t[0])
+    results = pl.collect_all([lf for _, lf in tails], **collect_kwargs)
+    return results, report
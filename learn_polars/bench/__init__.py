@@ -0,0 +1,22 @@
+"""
+Benchmark harness for the patterns in concepts/ and expressions/.
+
+The example scripts print results for 3-150 row frames; here the same
+queries run against synthetic data of any size and report wall time,
+peak RSS and rows/sec, so regressions between Polars versions show up
+as numbers.
+"""
+from learn_polars.bench.harness import Measurement, compare, measure, read_results, run, write_results
+from learn_polars.bench.workloads import WORKLOADS, Workload, workload
+
+__all__ = [
+    "Measurement",
+    "WORKLOADS",
+    "Workload",
+    "compare",
+    "measure",
+    "read_results",
+    "run",
+    "workload",
+    "write_results",
+]
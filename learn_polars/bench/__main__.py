@@ -0,0 +1,3 @@
+from learn_polars.bench.cli import main
+
+main()
@@ -0,0 +1,91 @@
+"""
+Command line entry point: `learn-polars-bench` (or `python -m learn_polars.bench`).
+
+    learn-polars-bench list
+    learn-polars-bench run --sizes 1e4 1e6 --workloads aggregation lazy -o results.json
+    learn-polars-bench compare baseline.parquet candidate.parquet
+    learn-polars-bench engines --size 2e9
+    learn-polars-bench generate legislators 1e8 --fmt ipc
+"""
+import argparse
+import importlib
+from pathlib import Path
+
+import polars as pl
+
+from learn_polars.bench import engines, harness, workloads
+from learn_polars.datasets import synthetic
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+
+def _size(value: str) -> int:
+    # accept 1e6 and 1_000_000 as well as 1000000
+    return int(float(value.replace("_", "")))
+
+
+def _query(spec: str) -> engines.Query:
+    # "package.module:function"
+    module, _, name = spec.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="learn-polars-bench", description=__doc__.splitlines()[1])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("list", help="list the registered workloads")
+
+    run = sub.add_parser("run", help="measure workloads at one or more data scales")
+    run.add_argument("--workloads", nargs="+", default=None, help="default: all")
+    run.add_argument("--scripts", nargs="+", default=None, help="only workloads from these scripts, e.g. 6_aggregation")
+    run.add_argument("--sizes", nargs="+", type=_size, default=DEFAULT_SIZES, help="row counts, e.g. 1e4 1e8")
+    run.add_argument("--repeat", type=int, default=1, help="report the best of N runs")
+    run.add_argument("--no-isolate", action="store_true", help="run in this process (peak RSS becomes cumulative)")
+    run.add_argument("-o", "--output", type=Path, default=Path("bench_results.json"), help=".json or .parquet")
+
+    cmp = sub.add_parser("compare", help="compare two results files, e.g. from two Polars versions")
+    cmp.add_argument("baseline", type=Path)
+    cmp.add_argument("candidate", type=Path)
+
+    eng = sub.add_parser("engines", help="run one query eagerly, lazily and streaming over a (replicated) CSV")
+    eng.add_argument("--csv", type=Path, default=Path(__file__).parents[2] / "data" / "iris.csv")
+    eng.add_argument("--size", type=_size, default=None, help="replicate the CSV to at least this many bytes")
+    eng.add_argument("--workdir", type=Path, default=Path(".bench_data"), help="where replicated CSVs are kept")
+    eng.add_argument("--query", type=_query, default=engines.iris_query, help="module:function, default: the iris query")
+
+    gen = sub.add_parser("generate", help="pre-generate (and cache) a synthetic dataset")
+    gen.add_argument("dataset", choices=sorted(synthetic.SCHEMAS))
+    gen.add_argument("rows", type=_size)
+    gen.add_argument("--seed", type=int, default=0)
+    gen.add_argument("--fmt", choices=["parquet", "ipc"], default="parquet")
+    gen.add_argument("--workers", type=int, default=None)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for w in workloads.WORKLOADS.values():
+            print(f"{w.name:<24} {w.script}")
+    elif args.command == "run":
+        names = args.workloads or list(workloads.WORKLOADS)
+        if args.scripts:
+            names = [n for n in names if any(s in workloads.get(n).script for s in args.scripts)]
+        results = harness.run(names, args.sizes, repeat=args.repeat, isolate=not args.no_isolate)
+        harness.write_results(results, args.output)
+        print(f"wrote {len(results)} measurements to {args.output}")
+    elif args.command == "compare":
+        out = harness.compare(harness.read_results(args.baseline), harness.read_results(args.candidate))
+        cols = ["workload", "rows", "polars_version", "polars_version_new", "time_ratio", "memory_ratio"]
+        with pl.Config(tbl_rows=-1, tbl_cols=-1):
+            print(out.select(cols))
+    elif args.command == "engines":
+        path = args.csv
+        if args.size:
+            path = engines.replicate_csv(path, args.workdir / f"{path.stem}_{args.size}.csv", args.size)
+        print(engines.format_results(engines.compare_engines(args.query, path)))
+    elif args.command == "generate":
+        print(synthetic.generate(args.dataset, args.rows, args.seed, fmt=args.fmt, workers=args.workers))
+
+
+if __name__ == "__main__":
+    main()
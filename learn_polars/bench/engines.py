@@ -0,0 +1,129 @@
+"""
+Eager vs lazy vs streaming, measured.
+
+concepts/5_lazy_eager_api.py and concepts/6_streaming_api.py describe why
+the lazy and streaming engines should need less memory and CPU for the
+iris query; this runner executes any query three ways over the same CSV
+and reports what actually happened:
+
+* eager:     query(pl.read_csv(path))
+* lazy:      query(pl.scan_csv(path)).collect()
+* streaming: query(pl.scan_csv(path)).collect(streaming=True)
+
+A query is a function that accepts a DataFrame or LazyFrame and chains
+methods both share (filter, groupby, agg, select, ...). It has to be a
+module level function because every engine runs in its own process.
+"""
+import time
+import warnings
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+import polars as pl
+
+from learn_polars.bench.harness import peak_rss_bytes, run_isolated
+from learn_polars.streaming import streaming_coverage
+
+Query = Callable[[pl.DataFrame | pl.LazyFrame], pl.DataFrame | pl.LazyFrame]
+
+ENGINES = ("eager", "lazy", "streaming")
+
+
+@dataclass
+class EngineResult:
+    engine: str
+    wall_s: float
+    peak_rss_bytes: int
+    height: int
+    plan: str
+    # "full", "partial" or "none"; only meaningful for the streaming engine
+    streaming: str | None = None
+
+
+def iris_query(frame):
+    """The query from concepts/5_lazy_eager_api.py and concepts/6_streaming_api.py."""
+    return frame.filter(pl.col("sepal_length") > 5).groupby("species").agg(pl.col("sepal_width").mean())
+
+
+def _run_engine(engine: str, query: Query, path: str) -> EngineResult:
+    if engine == "eager":
+        plan = "eager: no plan, every step materializes a DataFrame"
+        start = time.perf_counter()
+        out = query(pl.read_csv(path))
+        wall = time.perf_counter() - start
+        return EngineResult(engine, wall, peak_rss_bytes(), out.height, plan)
+
+    streaming = engine == "streaming"
+    lf = query(pl.scan_csv(path))
+    # streaming cannot be combined with common subplan elimination; polars
+    # would turn it off with a warning anyway
+    plan = lf.explain(streaming=streaming, common_subplan_elimination=not streaming)
+    start = time.perf_counter()
+    out = lf.collect(streaming=streaming, common_subplan_elimination=not streaming)
+    wall = time.perf_counter() - start
+    coverage = streaming_coverage(plan) if streaming else None
+    return EngineResult(engine, wall, peak_rss_bytes(), out.height, plan, coverage)
+
+
+def compare_engines(
+    query: Query,
+    path: str | Path,
+    engines: tuple[str, ...] = ENGINES,
+    isolate: bool = True,
+) -> list[EngineResult]:
+    """
+    Run `query` over the CSV at `path` with each engine and warn when the
+    streaming engine silently falls back to the in-memory engine.
+    """
+    results = []
+    for engine in engines:
+        if engine not in ENGINES:
+            raise ValueError(f"unknown engine {engine!r}, choose from {ENGINES}")
+        if isolate:
+            result = run_isolated(_run_engine, engine, query, str(path))
+        else:
+            result = _run_engine(engine, query, str(path))
+        if result.streaming in ("none", "partial"):
+            warnings.warn(
+                f"streaming engine {'did not stream' if result.streaming == 'none' else 'only partially streamed'} "
+                f"{getattr(query, '__name__', query)}; the rest ran in memory:\n{result.plan}",
+                stacklevel=2,
+            )
+        results.append(result)
+    return results
+
+
+def replicate_csv(source: str | Path, target: str | Path, target_bytes: int) -> Path:
+    """
+    Write `source` (header once, body repeated) to `target` until it is at
+    least `target_bytes` large, e.g. to turn the 150 row iris.csv into a
+    multi-GB file. An existing target of sufficient size is reused.
+    """
+    source, target = Path(source), Path(target)
+    if target.exists() and target.stat().st_size >= target_bytes:
+        return target
+    header, body = source.read_bytes().split(b"\n", 1)
+    if not body.endswith(b"\n"):
+        body += b"\n"
+    # write ~64MiB blocks instead of one tiny body at a time
+    block = body * max(1, (64 * 2**20) // len(body))
+    target.parent.mkdir(parents=True, exist_ok=True)
+    with target.open("wb") as f:
+        f.write(header + b"\n")
+        written = len(header) + 1
+        while written < target_bytes:
+            f.write(block)
+            written += len(block)
+    return target
+
+
+def format_results(results: list[EngineResult]) -> str:
+    lines = [f"{'engine':<10} {'seconds':>9} {'peak MiB':>10} {'rows':>8}  streaming"]
+    for r in results:
+        lines.append(
+            f"{r.engine:<10} {r.wall_s:>9.3f} {r.peak_rss_bytes / 2**20:>10.1f} {r.height:>8}  {r.streaming or '-'}"
+        )
+    for r in results:
+        lines.append(f"\n-- {r.engine} plan --\n{r.plan}")
+    return "\n".join(lines)
@@ -0,0 +1,182 @@
+"""
+Measure workloads in isolated worker processes.
+
+Peak RSS is a process-wide high-water mark, so every (workload, rows)
+pair runs in a freshly spawned interpreter: a large run can never hide
+the footprint of the next one. The worker builds the input, records the
+RSS reached by setup alone, then times the workload and reports the new
+high-water mark.
+"""
+import json
+import multiprocessing as mp
+import platform
+import queue as queue_module
+import resource
+import sys
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Iterable
+
+import polars as pl
+
+from learn_polars.bench import workloads
+
+
+@dataclass
+class Measurement:
+    workload: str
+    script: str
+    rows: int
+    wall_s: float
+    setup_rss_bytes: int
+    peak_rss_bytes: int
+    rows_per_s: float
+    polars_version: str
+    python_version: str
+    timestamp: str
+
+
+def peak_rss_bytes() -> int:
+    """High-water resident set size of the current process."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _measure_in_process(name: str, n_rows: int, repeat: int) -> dict:
+    work = workloads.get(name)
+    data = work.setup(n_rows)
+    setup_rss = peak_rss_bytes()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        work.run(data)
+        timings.append(time.perf_counter() - start)
+    wall = min(timings)
+    return asdict(
+        Measurement(
+            workload=name,
+            script=work.script,
+            rows=n_rows,
+            wall_s=wall,
+            setup_rss_bytes=setup_rss,
+            peak_rss_bytes=peak_rss_bytes(),
+            rows_per_s=n_rows / wall if wall > 0 else float("inf"),
+            polars_version=pl.__version__,
+            python_version=platform.python_version(),
+            timestamp=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        )
+    )
+
+
+def _worker(queue: mp.Queue, fn: Callable[..., Any], args: tuple) -> None:
+    try:
+        queue.put(("ok", fn(*args)))
+    except BaseException as e:  # report MemoryError & co. instead of dying silently
+        queue.put(("error", f"{type(e).__name__}: {e}"))
+
+
+def run_isolated(fn: Callable[..., Any], *args: Any) -> Any:
+    """
+    Call `fn(*args)` in a freshly spawned interpreter and return its result.
+
+    `fn` must be importable (a module level function) and its result
+    picklable.
+    """
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_worker, args=(queue, fn, args))
+    proc.start()
+    # drain before joining: a large result can block the child on a full pipe
+    while True:
+        try:
+            status, payload = queue.get(timeout=0.5)
+            break
+        except queue_module.Empty:
+            if not proc.is_alive() and queue.empty():
+                status, payload = "error", f"worker died with exit code {proc.exitcode}"
+                break
+    proc.join()
+    if status == "error":
+        raise RuntimeError(f"{getattr(fn, '__name__', fn)}{args} failed: {payload}")
+    return payload
+
+
+def measure(name: str, n_rows: int, repeat: int = 1, isolate: bool = True) -> Measurement:
+    """
+    Run workload `name` on `n_rows` rows and return its best wall time
+    over `repeat` runs together with the peak RSS of the process.
+    """
+    if isolate:
+        return Measurement(**run_isolated(_measure_in_process, name, n_rows, repeat))
+    return Measurement(**_measure_in_process(name, n_rows, repeat))
+
+
+def run(
+    names: Iterable[str],
+    sizes: Iterable[int],
+    repeat: int = 1,
+    isolate: bool = True,
+) -> list[Measurement]:
+    """Measure every workload at every size, skipping (and reporting) the ones that fail."""
+    results = []
+    for name in names:
+        for n_rows in sizes:
+            try:
+                m = measure(name, n_rows, repeat=repeat, isolate=isolate)
+            except RuntimeError as e:
+                print(e, file=sys.stderr)
+                continue
+            print(
+                f"{name:<24} {n_rows:>12,} rows  {m.wall_s:>9.4f}s  "
+                f"{m.peak_rss_bytes / 2**20:>9.1f} MiB  {m.rows_per_s:>14,.0f} rows/s"
+            )
+            results.append(m)
+    return results
+
+
+def write_results(results: list[Measurement], path: Path) -> None:
+    """Append to a .json (list of records) or write a .parquet results file."""
+    records = [asdict(m) for m in results]
+    if path.suffix == ".parquet":
+        if path.exists():
+            records = pl.read_parquet(path).to_dicts() + records
+        pl.DataFrame(records).write_parquet(path)
+    else:
+        if path.exists():
+            records = json.loads(path.read_text()) + records
+        path.write_text(json.dumps(records, indent=2))
+
+
+def read_results(path: Path) -> pl.DataFrame:
+    if path.suffix == ".parquet":
+        return pl.read_parquet(path)
+    return pl.DataFrame(json.loads(path.read_text()))
+
+
+def compare(baseline: pl.DataFrame, candidate: pl.DataFrame) -> pl.DataFrame:
+    """
+    Join two result sets on (workload, rows) and compute the time and
+    memory ratios candidate / baseline; ratios > 1 are regressions.
+    """
+    keys = ["workload", "rows"]
+    cols = ["wall_s", "peak_rss_bytes", "polars_version"]
+
+    def best(df: pl.DataFrame) -> pl.DataFrame:
+        return df.groupby(keys).agg(
+            pl.col("wall_s").min(),
+            pl.col("peak_rss_bytes").min(),
+            pl.col("polars_version").last(),
+        )
+
+    return (
+        best(baseline)
+        .join(best(candidate).rename({c: f"{c}_new" for c in cols}), on=keys)
+        .with_columns(
+            (pl.col("wall_s_new") / pl.col("wall_s")).alias("time_ratio"),
+            (pl.col("peak_rss_bytes_new") / pl.col("peak_rss_bytes")).alias("memory_ratio"),
+        )
+        .sort(keys)
+    )
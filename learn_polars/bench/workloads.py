@@ -0,0 +1,724 @@
+"""
+The queries from concepts/ and expressions/, replayed as benchmark workloads.
+
+Each workload pairs a `setup(n_rows)` that builds the input (not timed)
+with a `run(data)` that executes the script's queries on it (timed).
+Workloads are registered by name so they can be looked up again inside
+the worker process that measures them.
+"""
+import tempfile
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Callable
+
+import numpy as np
+import polars as pl
+import polars.selectors as cs
+
+from learn_polars import arrays, batch, cse, dtypes, external, folds, groups, inference, lists, result_cache, rowwise, selections, sketches, strings, temporal, udfs, urls, windows
+from learn_polars.datasets import synthetic
+from learn_polars.paths import default_cache_dir
+
+
+@dataclass(frozen=True)
+class Workload:
+    name: str
+    script: str
+    setup: Callable[[int], Any]
+    run: Callable[[Any], Any]
+
+
+WORKLOADS: dict[str, Workload] = {}
+
+
+def workload(name: str, script: str, setup: Callable[[int], Any]):
+    """Register the decorated function as the timed part of a workload."""
+
+    def decorator(run: Callable[[Any], Any]) -> Callable[[Any], Any]:
+        if name in WORKLOADS:
+            raise ValueError(f"workload {name!r} is already registered")
+        WORKLOADS[name] = Workload(name, script, setup, run)
+        return run
+
+    return decorator
+
+
+def get(name: str) -> Workload:
+    try:
+        return WORKLOADS[name]
+    except KeyError:
+        raise KeyError(f"unknown workload {name!r}, choose from {sorted(WORKLOADS)}") from None
+
+
+# concepts/
+
+
+@workload("data_structures", "concepts/2_data_structures.py", partial(synthetic.load, "mixed"))
+def _data_structures(df: pl.DataFrame):
+    return df.head(3), df.tail(3), df.sample(3), df.describe()
+
+
+@workload("contexts", "concepts/3_contexts.py", partial(synthetic.load, "mixed"))
+def _contexts(df: pl.DataFrame):
+    selected = df.select(
+        pl.sum("nrs"),
+        pl.col("names").sort(),
+        pl.col("names").first().alias("first name"),
+        (pl.mean("nrs") * 10).alias("10xnrs"),
+    )
+    df = df.with_columns(
+        pl.sum("nrs").alias("nrs_sum"),
+        pl.col("random").count().alias("count"),
+    )
+    filtered = df.filter(pl.col("nrs") > 2)
+    grouped = df.groupby("groups").agg(
+        pl.sum("nrs"),
+        pl.col("random").count().alias("count"),
+        pl.col("random").filter(pl.col("names").is_not_null()).sum().suffix("_sum"),
+        pl.col("names").reverse().alias("reversed names"),
+    )
+    return selected, filtered, grouped
+
+
+@workload("expressions", "concepts/4_expressions.py", partial(synthetic.load, "mixed"))
+def _expressions(df: pl.DataFrame):
+    return df.select(
+        pl.col("nrs").sort().head(2),
+        pl.col("random").filter(pl.col("nrs") == 1).sum(),
+    )
+
+
+def _iris_query(lf: pl.LazyFrame) -> pl.LazyFrame:
+    return lf.filter(pl.col("sepal_length") > 5).groupby("species").agg(pl.col("sepal_width").mean())
+
+
+@workload("eager", "concepts/5_lazy_eager_api.py", partial(synthetic.load, "iris"))
+def _eager(df: pl.DataFrame):
+    return df.filter(pl.col("sepal_length") > 5).groupby("species").agg(pl.col("sepal_width").mean())
+
+
+@workload("lazy", "concepts/5_lazy_eager_api.py", partial(synthetic.load, "iris"))
+def _lazy(df: pl.DataFrame):
+    return _iris_query(df.lazy()).collect()
+
+
+@workload("streaming", "concepts/6_streaming_api.py", partial(synthetic.load, "iris"))
+def _streaming(df: pl.DataFrame):
+    return _iris_query(df.lazy()).collect(streaming=True)
+
+
+# expressions/
+
+
+@workload("basic_operators", "expressions/1_basic_operators.py", partial(synthetic.load, "mixed"))
+def _basic_operators(df: pl.DataFrame):
+    numerical = df.select(
+        (pl.col("nrs") + 5).alias("nrs + 5"),
+        (pl.col("nrs") - 5).alias("nrs - 5"),
+        (pl.col("nrs") * pl.col("random")).alias("nrs * random"),
+        (pl.col("nrs") / pl.col("random")).alias("nrs / random"),
+    )
+    logical = df.select(
+        (pl.col("nrs") > 1).alias("nrs > 1"),
+        (pl.col("random") <= 0.5).alias("random <= .5"),
+        (pl.col("nrs") != 1).alias("nrs != 1"),
+        (pl.col("nrs") == 1).alias("nrs == 1"),
+        ((pl.col("random") <= 0.5) & (pl.col("nrs") > 1)).alias("and_expr"),
+        ((pl.col("random") <= 0.5) | (pl.col("nrs") > 1)).alias("or_expr"),
+    )
+    return numerical, logical
+
+
+@workload("column_selections", "expressions/2_column_selections.py", partial(synthetic.load, "pokemon"))
+def _column_selections(df: pl.DataFrame):
+    return (
+        df.select(pl.col("^.*(pe|ta).*$")),
+        df.select(pl.col(pl.Int64, pl.Boolean).n_unique()),
+        df.select(cs.numeric() - cs.first()),
+        df.select(cs.by_name("#"), ~cs.numeric()),
+    )
+
+
+_SELECTION_COLUMNS = 5_000
+
+
+def _wide_selections(n_rows: int) -> pl.DataFrame:
+    """`n_rows` values over 5,000 day columns, some of them floats or strings."""
+    df = synthetic.load("wide", max(1, n_rows // _SELECTION_COLUMNS), cardinality={"days": _SELECTION_COLUMNS})
+    return df.with_columns(cs.matches("[05]$").cast(pl.Float64), cs.matches("7$").cast(pl.Utf8))
+
+
+def _select_wide(df: pl.DataFrame, columns: Callable[[Any], list], names: Callable[[Any], Any]) -> list:
+    """The 2_column_selections.py queries, planned a few times over as a pipeline would."""
+    out = []
+    for _ in range(5):
+        out += [
+            df.select(*columns(pl.col("^day_1.*$"))),
+            df.select(*columns(cs.numeric() - cs.first())),
+            df.select(*columns(cs.by_name("day_1")), *columns(~cs.numeric())),
+            df.select(*columns(cs.float() | cs.string())),
+            names(cs.integer() & cs.ends_with("3")),
+        ]
+    return out
+
+
+@workload("column_selections_wide", "expressions/2_column_selections.py", _wide_selections)
+def _column_selections_wide(df: pl.DataFrame):
+    return _select_wide(df, lambda selection: [selection], partial(cs.selector_column_names, df))
+
+
+@workload("column_selections_cached", "expressions/2_column_selections.py", _wide_selections)
+def _column_selections_cached(df: pl.DataFrame):
+    cache = selections.SelectorCache()
+    bound = cache.bind(df)
+    return _select_wide(df, bound.columns, bound.names)
+
+
+@workload("functions", "expressions/3_functions.py", partial(synthetic.load, "mixed"))
+def _functions(df: pl.DataFrame):
+    return (
+        df.select(pl.all().map_alias(lambda x: x + "_foo")),
+        df.select(
+            pl.col("names").n_unique().alias("unique"),
+            pl.approx_unique("names").alias("unique_approx"),
+        ),
+        df.select(
+            pl.col("nrs"),
+            pl.when(pl.col("nrs") > 2).then(pl.lit(True)).otherwise(pl.lit(False)).alias("conditional"),
+        ),
+    )
+
+
+def _birth_years(n_rows: int) -> pl.DataFrame:
+    df = synthetic.load("legislators", n_rows)
+    return df.select("state", pl.col("birthday").dt.year().cast(pl.Int64).alias("year"), "last_name").sort("year")
+
+
+def _rollups(df: pl.DataFrame, agg: pl.Expr) -> list[pl.DataFrame]:
+    """Distinct last names over trailing 10 years per state, per state and per year."""
+    return [
+        df.groupby_dynamic("year", every="1i", period="10i", by="state").agg(agg),
+        df.groupby("state", maintain_order=True).agg(agg),
+        df.groupby("year", maintain_order=True).agg(agg),
+    ]
+
+
+@workload("distinct_exact", "expressions/3_functions.py", _birth_years)
+def _distinct_exact(df: pl.DataFrame):
+    return _rollups(df, pl.col("last_name").n_unique())
+
+
+def _yearly_sketches(n_rows: int) -> pl.DataFrame:
+    # built once as the rows arrive and stored with them, as a daily job would
+    return sketches.HyperLogLog().agg(_birth_years(n_rows), ["state", "year"], "last_name").sort("year")
+
+
+@workload("distinct_sketches", "expressions/3_functions.py", _yearly_sketches)
+def _distinct_sketches(yearly: pl.DataFrame):
+    hll = sketches.HyperLogLog()
+    out = _rollups(yearly, hll.merge_expr("last_name_hll"))
+    return [rollup.with_columns(hll.estimate(rollup["last_name_hll"]).alias("distinct")) for rollup in out]
+
+
+@workload("casting", "expressions/4_casting.py", partial(synthetic.load, "pokemon"))
+def _casting(df: pl.DataFrame):
+    return (
+        df.select(
+            pl.col("Attack").cast(pl.Float32).alias("integers_as_floats"),
+            pl.col("Attack").cast(pl.Int16).alias("integers_smallfootprint"),
+            pl.col("Total").cast(pl.Int8, strict=False),
+        ),
+        df.select(pl.col("Attack").cast(pl.Utf8).cast(pl.Float64)),
+    )
+
+
+@workload("optimize_dtypes", "expressions/4_casting.py", partial(synthetic.load, "wide", cardinality={"days": 300}))
+def _optimize_dtypes(df: pl.DataFrame):
+    return dtypes.optimize_dtypes(df, categorical_ratio=0.5)
+
+
+def _birthday_strings(n_rows: int) -> pl.DataFrame:
+    # birthdays as the CSV has them, ~1% of them unparseable
+    df = synthetic.load("legislators", n_rows).select("birthday")
+    return df.with_columns(
+        pl.when(pl.arange(0, pl.count()) % 100 == 0)
+        .then(pl.lit("unknown"))
+        .otherwise(pl.col("birthday").dt.strftime("%Y-%m-%d"))
+        .alias("birthday")
+    )
+
+
+@workload("temporal_strptime", "expressions/4_casting.py", _birthday_strings)
+def _temporal_strptime(df: pl.DataFrame):
+    return df.with_columns(pl.col("birthday").str.strptime(pl.Date, strict=False))
+
+
+@workload("temporal_parse", "expressions/4_casting.py", _birthday_strings)
+def _temporal_parse(df: pl.DataFrame):
+    result = temporal.parse(df, "birthday")
+    return result.frame, result.quarantine
+
+
+@workload("strings", "expressions/5_strings.py", partial(synthetic.load, "urls"))
+def _strings(df: pl.DataFrame):
+    return df.select(
+        pl.col("a").str.lengths().alias("byte_count"),
+        pl.col("a").str.n_chars().alias("letter_count"),
+        pl.col("a").str.contains("cat|bit").alias("regex"),
+        pl.col("a").str.extract(r"candidate=(\w+)", group_index=1).alias("candidate"),
+        pl.col("a").str.extract_all(r"(\d+)").alias("extracted_nrs"),
+        pl.col("a").str.replace_all("a", "-", literal=True).alias("text_replace_all"),
+    )
+
+
+_MATCHER = strings.Matcher(
+    contains={"regex": "cat|bit"},
+    extract={"candidate": r"candidate=(\w+)"},
+    extract_all={"extracted_nrs": r"(\d+)"},
+)
+
+
+@workload("strings_matcher", "expressions/5_strings.py", partial(synthetic.load, "urls"))
+def _strings_matcher(df: pl.DataFrame):
+    return df.select(
+        pl.col("a").str.lengths().alias("byte_count"),
+        pl.col("a").str.n_chars().alias("letter_count"),
+        *_MATCHER.exprs("a"),
+        pl.col("a").str.replace_all("a", "-", literal=True).alias("text_replace_all"),
+    )
+
+
+# RFC 3986, appendix B
+_URL_PATTERN = r"^(?:([a-zA-Z][a-zA-Z0-9+.-]*):)?(?://([^/?#]*))?([^?#]*)(?:\?([^#]*))?(?:#(.*))?$"
+
+
+@workload("urls_regex", "expressions/5_strings.py", partial(synthetic.load, "urls"))
+def _urls_regex(df: pl.DataFrame):
+    parts = [pl.col("a").str.extract(_URL_PATTERN, i).alias(part) for i, part in enumerate(urls.PARTS, 1)]
+    return df.select(pl.struct(parts).alias("a_parts"), pl.col("a").str.extract(r"[?&]candidate=([^&#]*)", 1))
+
+
+@workload("urls_split", "expressions/5_strings.py", partial(synthetic.load, "urls"))
+def _urls_split(df: pl.DataFrame):
+    return urls.split(df, "a").select("a_parts", urls.query_value(pl.col("a"), "candidate"))
+
+
+def _person() -> pl.Expr:
+    return pl.col("first_name") + pl.lit(" ") + pl.col("last_name")
+
+
+def _age() -> pl.Expr:
+    return 2021 - pl.col("birthday").dt.year()
+
+
+def _aggregation_queries(src):
+    by_name = (
+        src.groupby("first_name")
+        .agg(pl.count(), pl.col("gender"), pl.first("last_name"))
+        .sort("count", descending=True)
+        .limit(5)
+    )
+    by_state = (
+        src.groupby("state")
+        .agg(
+            (pl.col("party") == "Anti-Administration").sum().alias("anti"),
+            (pl.col("party") == "Pro-Administration").sum().alias("pro"),
+        )
+        .sort("pro", descending=True)
+        .limit(5)
+    )
+    youngest = (
+        src.sort("birthday", descending=True)
+        .groupby("state")
+        .agg(
+            _person().first().alias("youngest"),
+            _person().last().alias("oldest"),
+        )
+        .limit(5)
+    )
+    alphabetical = (
+        src.sort("birthday", descending=True)
+        .groupby("state")
+        .agg(
+            _person().first().alias("youngest"),
+            _person().last().alias("oldest"),
+            _person().sort().first().alias("alphabetical_first"),
+        )
+        .limit(5)
+    )
+    return [by_name, by_state, youngest, alphabetical]
+
+
+@workload("aggregation", "expressions/6_aggregation.py", partial(synthetic.load, "legislators"))
+def _aggregation(dataset: pl.DataFrame):
+    return [q.collect() for q in _aggregation_queries(dataset.lazy())]
+
+
+@workload("aggregation_batch", "expressions/6_aggregation.py", partial(synthetic.load, "legislators"))
+def _aggregation_batch(dataset: pl.DataFrame):
+    return batch.collect_batch(_aggregation_queries(batch.track(dataset)))
+
+
+def _scanned_legislators(n_rows: int) -> pl.LazyFrame:
+    # scanned, not loaded: results over an in-memory frame aren't cached; and
+    # not rechunked: a rechunked glob scan can't be serialized to a cache key
+    return pl.scan_parquet(synthetic.generate("legislators", n_rows) / "*.parquet", rechunk=False)
+
+
+def _dashboard(n_rows: int, warm: bool) -> tuple[pl.LazyFrame, result_cache.ResultCache]:
+    lf = _scanned_legislators(n_rows)
+    cache = result_cache.ResultCache(default_cache_dir() / "bench" / f"results-{'warm' if warm else 'cold'}")
+    cache.clear()
+    if warm:
+        for q in _aggregation_queries(lf):
+            cache.collect(q)
+    return lf, cache
+
+
+@workload("aggregation_scan", "expressions/6_aggregation.py", _scanned_legislators)
+def _aggregation_scan(lf: pl.LazyFrame):
+    return [q.collect() for q in _aggregation_queries(lf)]
+
+
+@workload("aggregation_results_cold", "expressions/6_aggregation.py", partial(_dashboard, warm=False))
+def _aggregation_results_cold(data: tuple[pl.LazyFrame, result_cache.ResultCache]):
+    lf, cache = data
+    # every repeat starts empty: collected, then written to the cache
+    cache.clear()
+    return [cache.collect(q) for q in _aggregation_queries(lf)]
+
+
+@workload("aggregation_results_warm", "expressions/6_aggregation.py", partial(_dashboard, warm=True))
+def _aggregation_results_warm(data: tuple[pl.LazyFrame, result_cache.ResultCache]):
+    lf, cache = data
+    return [cache.collect(q) for q in _aggregation_queries(lf)]
+
+
+def _helper_queries(src):
+    """The 6_aggregation.py groupbys that use `get_person()` / `compute_age()` more than once."""
+    ages = src.groupby("state").agg(
+        *(_age().filter(pl.col("gender") == gender).mean().alias(f"avg {gender} birthday") for gender in "MF"),
+        (pl.col("gender") == "M").sum().alias("# male"),
+        (pl.col("gender") == "F").sum().alias("# female"),
+    )
+    people = (
+        src.sort("birthday", descending=True)
+        .groupby("state")
+        .agg(
+            _person().first().alias("youngest"),
+            _person().last().alias("oldest"),
+            _person().sort().first().alias("alphabetical_first"),
+        )
+    )
+    return [ages, people]
+
+
+@workload("aggregation_helpers", "expressions/6_aggregation.py", partial(synthetic.load, "legislators"))
+def _aggregation_helpers(dataset: pl.DataFrame):
+    return [q.collect() for q in _helper_queries(dataset.lazy())]
+
+
+@workload("aggregation_helpers_cse", "expressions/6_aggregation.py", partial(synthetic.load, "legislators"))
+def _aggregation_helpers_cse(dataset: pl.DataFrame):
+    return [cse.rewrite(q)[0].collect() for q in _helper_queries(batch.track(dataset))]
+
+
+def _youngest_by_state(lf: pl.LazyFrame) -> pl.LazyFrame:
+    return (
+        lf.sort(["birthday", "id"], descending=True)
+        .groupby("state")
+        .agg(_person().first().alias("youngest"), _person().last().alias("oldest"), pl.count())
+    )
+
+
+def _tenth(df: pl.DataFrame) -> int:
+    # a budget a tenth of the data, as if it were 10x the RAM
+    return max(1, int(df.estimated_size()) // 10)
+
+
+@workload("aggregation_in_memory", "expressions/6_aggregation.py", partial(synthetic.load, "legislators"))
+def _aggregation_in_memory(dataset: pl.DataFrame):
+    return _youngest_by_state(dataset.lazy()).collect(), dataset.sort("birthday", descending=True)
+
+
+@workload("aggregation_external", "expressions/6_aggregation.py", partial(synthetic.load, "legislators"))
+def _aggregation_external(dataset: pl.DataFrame):
+    youngest, _ = external.run_partitioned(dataset, "state", _youngest_by_state, _tenth(dataset))
+    with tempfile.TemporaryDirectory() as output:
+        lf, _ = external.sort(dataset, "birthday", _tenth(dataset), descending=True, output=output)
+        return youngest, lf.collect()
+
+
+# independent queries over the same frame and keys, as a service would run them
+_GROUP_QUERIES = [
+    ("state", [pl.count()]),
+    ("state", [pl.col("birthday").min().alias("oldest"), pl.col("birthday").max().alias("youngest")]),
+    ("first_name", [pl.count(), pl.col("last_name").first()]),
+    (["first_name", "state"], [pl.count()]),
+    (["first_name", "state"], [pl.col("birthday").max()]),
+    (["state", "party"], [pl.col("id").mean()]),
+]
+
+
+@workload("group_queries", "expressions/6_aggregation.py", partial(synthetic.load, "legislators"))
+def _group_queries(dataset: pl.DataFrame):
+    out = [dataset.groupby(by, maintain_order=True).agg(aggs) for by, aggs in _GROUP_QUERIES * 2]
+    out.append(dataset.select(pl.col("birthday").max().over("state"), pl.count().over(["first_name", "state"])))
+    return out
+
+
+@workload("group_queries_cached", "expressions/6_aggregation.py", partial(synthetic.load, "legislators"))
+def _group_queries_cached(dataset: pl.DataFrame):
+    cache = groups.GroupCache(dataset)
+    out = [cache.groupby(by, *aggs) for by, aggs in _GROUP_QUERIES * 2]
+    out.append(cache.over("state", pl.col("birthday").max()))
+    out.append(cache.over(["first_name", "state"], pl.count()))
+    return out
+
+
+@workload("missing_data", "expressions/7_missing_data.py", partial(synthetic.load, "mixed"))
+def _missing_data(df: pl.DataFrame):
+    return (
+        df.null_count(),
+        df.with_columns(pl.col("nrs").fill_null(pl.lit(2))),
+        df.with_columns(pl.col("nrs").fill_null(strategy="forward")),
+        df.with_columns(pl.col("nrs").fill_null(pl.median("nrs"))),
+        df.with_columns(pl.col("nrs").interpolate()),
+    )
+
+
+@workload("window_functions", "expressions/8_window_functions.py", partial(synthetic.load, "pokemon"))
+def _window_functions(df: pl.DataFrame):
+    over = df.select(
+        "Type 1",
+        "Type 2",
+        pl.col("Attack").mean().over("Type 1").alias("avg_attack_by_type"),
+        pl.col("Defense").mean().over(["Type 1", "Type 2"]).alias("avg_defense_by_type_combination"),
+        pl.col("Attack").mean().alias("avg_attack"),
+    )
+    explode = df.sort("Type 1").select(
+        pl.col("Type 1").head(3).over("Type 1", mapping_strategy="explode"),
+        pl.col("Name").sort_by(pl.col("Speed")).head(3).over("Type 1", mapping_strategy="explode").alias("fastest/group"),
+    )
+    return over, explode
+
+
+def _window_exprs() -> list[pl.Expr]:
+    return [
+        pl.col("Attack").mean().over("Type 1").alias("avg_attack_by_type"),
+        pl.col("Defense").mean().over(["Type 1", "Type 2"]).alias("avg_defense_by_type_combination"),
+    ]
+
+
+_MANY_TYPES = {"Type 1": 200_000, "Type 2": 200_000}
+
+
+@workload("window_many_groups", "expressions/8_window_functions.py", partial(synthetic.load, "pokemon", cardinality=_MANY_TYPES))
+def _window_many_groups(df: pl.DataFrame):
+    return df.select(_window_exprs())
+
+
+@workload("window_processes", "expressions/8_window_functions.py", partial(synthetic.load, "pokemon", cardinality=_MANY_TYPES))
+def _window_processes(df: pl.DataFrame):
+    # the pool is started inside the measurement: its spawn cost counts
+    with windows.executor() as pool:
+        return windows.select(df, _window_exprs(), pool=pool)
+
+
+def _sorted_groups(n_rows: int, skew: str) -> pl.DataFrame:
+    # ~100 rows per group on average, sorted by group as after df.sort("Type 1")
+    rng = np.random.default_rng(0)
+    n_groups = max(1, n_rows // 100)
+    if skew == "uniform":
+        groups = rng.integers(0, n_groups, n_rows)
+    else:
+        # a few huge groups and a long tail of tiny ones
+        groups = (rng.zipf(1.3, n_rows) - 1) % n_groups
+    return pl.DataFrame({"Type 1": groups, "Attack": rng.integers(5, 190, n_rows)}).sort("Type 1")
+
+
+def _strategy_workload(strategy: str, skew: str) -> None:
+    # join repeats the group's values on every row: on a same-length
+    # expression that is a list of the whole group per row, so join gets
+    # the top 3 per group (the case it is meant for) instead
+    expr = pl.col("Attack").cumsum() if strategy != "join" else pl.col("Attack").sort(descending=True).head(3)
+
+    @workload(f"window_{strategy}_{skew}", "expressions/8_window_functions.py", partial(_sorted_groups, skew=skew))
+    def _run(df: pl.DataFrame):
+        return df.select(expr.over("Type 1", mapping_strategy=strategy))
+
+
+for _skew in ("uniform", "skewed"):
+    for _strategy in ("group_to_rows", "explode", "join"):
+        _strategy_workload(_strategy, _skew)
+
+
+@workload("window_planned_skewed", "expressions/8_window_functions.py", partial(_sorted_groups, skew="skewed"))
+def _window_planned_skewed(df: pl.DataFrame):
+    expr, _ = windows.over(df, pl.col("Attack").cumsum(), "Type 1")
+    return df.select(expr)
+
+
+@workload("folds", "expressions/9_folds.py", partial(synthetic.load, "pokemon"))
+def _folds(df: pl.DataFrame):
+    stats = cs.by_name("HP", "Attack", "Defense", "Sp. Atk", "Sp. Def", "Speed")
+    return (
+        df.select(pl.fold(acc=pl.lit(0), function=lambda acc, x: acc + x, exprs=stats).alias("sum")),
+        df.filter(pl.fold(acc=pl.lit(True), function=lambda acc, x: acc & x, exprs=stats > 10)),
+    )
+
+
+@workload("folds_wide", "expressions/9_folds.py", partial(synthetic.load, "wide", cardinality={"days": 300}))
+def _folds_wide(df: pl.DataFrame):
+    days = cs.starts_with("day_")
+    return (
+        df.select(pl.fold(acc=pl.lit(0), function=lambda acc, x: acc + x, exprs=days).alias("sum")),
+        df.filter(pl.fold(acc=pl.lit(True), function=lambda acc, x: acc & x, exprs=days > 1)),
+    )
+
+
+@workload("folds_native", "expressions/9_folds.py", partial(synthetic.load, "wide", cardinality={"days": 300}))
+def _folds_native(df: pl.DataFrame):
+    days = cs.starts_with("day_")
+    return (
+        df.select(folds.fold(acc=pl.lit(0), function=lambda acc, x: acc + x, exprs=days, schema=df.schema).alias("sum")),
+        df.filter(folds.fold(acc=pl.lit(True), function=lambda acc, x: acc & x, exprs=days > 1, schema=df.schema)),
+    )
+
+
+@workload("lists_and_arrays", "expressions/10_lists_and_arrays.py", partial(synthetic.load, "temperatures"))
+def _lists_and_arrays(weather: pl.DataFrame):
+    weather_list = weather.select(pl.col("station"), pl.col("temperatures").str.split(" "))
+    return weather_list.with_columns(
+        pl.col("temperatures").list.eval(pl.element().cast(pl.Int64, strict=False).is_null()).list.sum().alias("errors")
+    )
+
+
+@workload("split_parse_eval", "expressions/10_lists_and_arrays.py", partial(synthetic.load, "temperatures", cardinality={"tokens": 20}))
+def _split_parse_eval(weather: pl.DataFrame):
+    temperatures = pl.col("temperatures").str.split(" ")
+    return weather.with_columns(
+        temperatures.list.eval(pl.element().cast(pl.Int64, strict=False)).alias("temperatures_values"),
+        temperatures.list.eval(pl.element().cast(pl.Int64, strict=False).is_null()).list.sum().alias("temperatures_errors"),
+    )
+
+
+@workload("split_parse_fused", "expressions/10_lists_and_arrays.py", partial(synthetic.load, "temperatures", cardinality={"tokens": 20}))
+def _split_parse_fused(weather: pl.DataFrame):
+    return lists.parse(weather, "temperatures")
+
+
+_VECTOR_WIDTH = 64
+
+
+def _vectors(n_rows: int, dtype: pl.PolarsDataType) -> pl.DataFrame:
+    # two columns of embeddings, as Arrays or as Lists of the same values
+    rng = np.random.default_rng(0)
+    columns = [arrays.from_numpy(name, rng.standard_normal((n_rows, _VECTOR_WIDTH))) for name in ("a", "b")]
+    return pl.DataFrame([s if dtype == pl.Array else s.cast(pl.List(pl.Float64)) for s in columns])
+
+
+def _query() -> np.ndarray:
+    return np.random.default_rng(1).standard_normal(_VECTOR_WIDTH)
+
+
+@workload("vector_ops_list", "expressions/10_lists_and_arrays.py", partial(_vectors, dtype=pl.List))
+def _vector_ops_list(df: pl.DataFrame):
+    q = _query()
+    # list.eval can't combine the elements with a literal vector: explode and group the rows back
+    rows = df.with_row_count("row").explode(["a", "b"]).with_columns(pl.lit(pl.Series(np.tile(q, df.height))).alias("q"))
+    by_row = rows.groupby("row", maintain_order=True).agg(
+        (pl.col("a") * pl.col("q")).sum().alias("dot"), (pl.col("a") + pl.col("b")).alias("sum")
+    )
+    norm = df.select(pl.col("a").list.eval((pl.element() * pl.element()).sum().sqrt()).list.first().alias("norm"))
+    return (
+        by_row.get_column("dot"),
+        norm,
+        by_row.get_column("dot") / (norm.get_column("norm") * np.linalg.norm(q)),
+        df.select(pl.col("a").list.arg_max()),
+        by_row.get_column("sum"),
+    )
+
+
+@workload("vector_ops_array", "expressions/10_lists_and_arrays.py", partial(_vectors, dtype=pl.Array))
+def _vector_ops_array(df: pl.DataFrame):
+    q = _query()
+    return df.select(
+        arrays.dot(pl.col("a"), q).alias("dot"),
+        arrays.norm(pl.col("a")).alias("norm"),
+        arrays.cosine(pl.col("a"), q).alias("cosine"),
+        arrays.argmax(pl.col("a")).alias("argmax"),
+        arrays.add(pl.col("a"), pl.col("b")).alias("sum"),
+    )
+
+
+@workload("row_wise_rank", "expressions/10_lists_and_arrays.py", partial(synthetic.load, "wide"))
+def _row_wise_rank(weather_by_day: pl.DataFrame):
+    rank_pct = (pl.element().rank(descending=True) / pl.col("*").count()).round(2)
+    return weather_by_day.select(
+        pl.all().exclude("station"),
+        pl.concat_list(pl.all().exclude("station")).list.eval(rank_pct, parallel=True).alias("temps_rank"),
+    )
+
+
+@workload("row_wise_rank_wide", "expressions/10_lists_and_arrays.py", partial(synthetic.load, "wide", cardinality={"days": 100}))
+def _row_wise_rank_wide(weather_by_day: pl.DataFrame):
+    return _row_wise_rank(weather_by_day)
+
+
+@workload("row_wise_rank_columns", "expressions/10_lists_and_arrays.py", partial(synthetic.load, "wide", cardinality={"days": 100}))
+def _row_wise_rank_columns(weather_by_day: pl.DataFrame):
+    days = weather_by_day.select(pl.all().exclude("station"))
+    return days.hstack(rowwise.rank(days, pl.all(), descending=True, pct=True).select(pl.all().round(2)))
+
+
+@workload("user_defined_functions", "expressions/11_user_defined_functions.py", partial(synthetic.load, "mixed"))
+def _user_defined_functions(df: pl.DataFrame):
+    return df.groupby("groups", maintain_order=True).agg(
+        pl.col("nrs").map(lambda s: s.shift()).alias("shift_map"),
+        pl.col("nrs").shift().alias("shift_expression"),
+    )
+
+
+def _udf_query(df: pl.DataFrame) -> batch.Tracked:
+    return batch.track(df).with_columns(
+        pl.col("random").apply(lambda v: v * 2 + 1).alias("scaled"),
+        pl.col("nrs").map(lambda s: s.cumsum()).alias("running"),
+    )
+
+
+class _Model:
+    """A small two-layer network standing in for MyNeuralNetwork in 11_user_defined_functions.py."""
+
+    def __init__(self, hidden: int = 64, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.w1 = rng.standard_normal((1, hidden)).astype(np.float32)
+        self.w2 = rng.standard_normal((hidden, 1)).astype(np.float32)
+
+    def forward(self, x: np.ndarray) -> np.ndarray:
+        return (np.tanh(x.reshape(-1, 1) @ self.w1) @ self.w2).ravel()
+
+
+@workload("inference_single_call", "expressions/11_user_defined_functions.py", partial(synthetic.load, "mixed"))
+def _inference_single_call(df: pl.DataFrame):
+    model = _Model()
+    return df.with_columns(pl.col("random").map(lambda s: pl.Series(model.forward(s.to_numpy()))).alias("activations"))
+
+
+@workload("inference_batched", "expressions/11_user_defined_functions.py", partial(synthetic.load, "mixed"))
+def _inference_batched(df: pl.DataFrame):
+    model = _Model()
+    return df.with_columns(
+        inference.predict(pl.col("random"), model.forward, batch_size=65_536, workers=4).alias("activations")
+    )
+
+
+@workload("user_defined_functions_apply", "expressions/11_user_defined_functions.py", partial(synthetic.load, "mixed"))
+def _user_defined_functions_apply(df: pl.DataFrame):
+    return _udf_query(df).collect()
+
+
+@workload("user_defined_functions_native", "expressions/11_user_defined_functions.py", partial(synthetic.load, "mixed"))
+def _user_defined_functions_native(df: pl.DataFrame):
+    lf, _ = udfs.rewrite(_udf_query(df))
+    return lf.collect()
@@ -0,0 +1,10 @@
+"""
+Data for the examples and for scaling experiments.
+
+* fetch: the real datasets the examples download, cached offline and typed
+* ingest: one-off CSV -> Parquet conversion with a persisted schema
+* synthetic: look-alikes of those datasets at any size
+"""
+from learn_polars.datasets import fetch, ingest, synthetic
+
+__all__ = ["fetch", "ingest", "synthetic"]
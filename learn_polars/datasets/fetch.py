@@ -0,0 +1,179 @@
+"""
+Offline, content-addressed cache for the datasets the examples download.
+
+expressions/6_aggregation.py and expressions/8_window_functions.py used
+to read their CSVs over HTTP on every run. Here each file is
+
+1. downloaded once and stored under its sha256 (`blobs/<sha256>.csv`),
+   checked against a pinned hash when one is known, otherwise against
+   the hash recorded the first time it was fetched;
+2. converted once to a typed IPC file with the dtypes the scripts ask for
+   (Categorical columns, parsed dates) already applied;
+3. served from then on via a memory-mapped `scan_ipc`, without touching
+   the network.
+
+Set LEARN_POLARS_MIRROR to a directory (or base URL) holding files with
+the same names as the remote ones to fetch from a local fixture instead.
+
+    dataset = fetch.load("legislators")
+    lf = fetch.scan("pokemon")
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import urllib.request
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+import polars as pl
+
+from learn_polars.paths import default_cache_dir
+
+# bump when a transform changes so typed files are rebuilt
+TYPED_VERSION = 1
+
+
+@dataclass(frozen=True)
+class Source:
+    url: str
+    # pinned content hash; None trusts the first download and pins that
+    sha256: str | None = None
+    dtypes: dict[str, pl.PolarsDataType] = field(default_factory=dict)
+    transform: Callable[[pl.DataFrame], pl.DataFrame] | None = None
+
+
+def _parse_birthday(df: pl.DataFrame) -> pl.DataFrame:
+    return df.with_columns(pl.col("birthday").str.strptime(pl.Date, strict=False))
+
+
+SOURCES: dict[str, Source] = {
+    "legislators": Source(
+        "https://theunitedstates.io/congress-legislators/legislators-historical.csv",
+        dtypes={c: pl.Categorical for c in ("first_name", "gender", "type", "state", "party")},
+        transform=_parse_birthday,
+    ),
+    "pokemon": Source(
+        "https://gist.githubusercontent.com/ritchie46/cac6b337ea52281aa23c049250a4ff03/raw/"
+        "89a957ff3919d90e6ef2d34235e6bf22304f3366/pokemon.csv",
+    ),
+}
+
+
+def _source(name: str) -> Source:
+    try:
+        return SOURCES[name]
+    except KeyError:
+        raise KeyError(f"unknown dataset {name!r}, choose from {sorted(SOURCES)}") from None
+
+
+def _root(cache_dir: Path | None) -> Path:
+    return (cache_dir or default_cache_dir()) / "datasets"
+
+
+def _read_manifest(root: Path) -> dict:
+    path = root / "manifest.json"
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def _write_manifest(root: Path, manifest: dict) -> None:
+    tmp = root / "manifest.json.tmp"
+    tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    tmp.replace(root / "manifest.json")
+
+
+def _resolve_url(url: str) -> str:
+    mirror = os.environ.get("LEARN_POLARS_MIRROR")
+    if not mirror:
+        return url
+    file_name = url.rsplit("/", 1)[-1]
+    if "://" in mirror:
+        return f"{mirror.rstrip('/')}/{file_name}"
+    return Path(mirror, file_name).resolve().as_uri()
+
+
+def _download(url: str, directory: Path) -> tuple[Path, str]:
+    digest = hashlib.sha256()
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".download-")
+    try:
+        with os.fdopen(fd, "wb") as out, urllib.request.urlopen(url, timeout=60) as response:
+            for block in iter(lambda: response.read(2**20), b""):
+                digest.update(block)
+                out.write(block)
+    except BaseException:
+        # a failed or interrupted download leaves no partial file behind
+        os.unlink(tmp)
+        raise
+    return Path(tmp), digest.hexdigest()
+
+
+def _expected_sha256(name: str, root: Path) -> str | None:
+    return _source(name).sha256 or _read_manifest(root).get(name, {}).get("sha256")
+
+
+def _typed_path(root: Path, sha256: str) -> Path:
+    return root / "typed" / f"{sha256}-v{TYPED_VERSION}.arrow"
+
+
+def fetch(name: str, cache_dir: Path | None = None) -> Path:
+    """Return the path of the verified raw file, downloading it only if it is not cached."""
+    source = _source(name)
+    root = _root(cache_dir)
+    (root / "blobs").mkdir(parents=True, exist_ok=True)
+    manifest = _read_manifest(root)
+    expected = _expected_sha256(name, root)
+
+    if expected and (blob := root / "blobs" / f"{expected}.csv").exists():
+        return blob
+
+    url = _resolve_url(source.url)
+    tmp, digest = _download(url, root / "blobs")
+    if expected and digest != expected:
+        tmp.unlink()
+        raise ValueError(
+            f"{name}: {url} has sha256 {digest}, expected {expected}. "
+            f"Remove the entry from {root / 'manifest.json'} to accept the new content."
+        )
+    blob = root / "blobs" / f"{digest}.csv"
+    tmp.replace(blob)
+    manifest[name] = {"url": source.url, "sha256": digest}
+    _write_manifest(root, manifest)
+    return blob
+
+
+def materialize(name: str, cache_dir: Path | None = None) -> Path:
+    """Return the typed IPC copy of dataset `name`, converting the raw file once."""
+    source = _source(name)
+    root = _root(cache_dir)
+    # the typed copy is enough on its own, the raw file may have been pruned
+    expected = _expected_sha256(name, root)
+    if expected and (typed := _typed_path(root, expected)).exists():
+        return typed
+
+    blob = fetch(name, cache_dir)
+    typed = _typed_path(root, blob.stem)
+
+    df = pl.read_csv(blob, dtypes=source.dtypes)
+    if source.transform is not None:
+        df = source.transform(df)
+    typed.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=typed.parent, prefix=".typed-")
+    os.close(fd)
+    try:
+        # uncompressed, so that scan_ipc can memory map it
+        df.write_ipc(tmp, compression="uncompressed")
+        shutil.move(tmp, typed)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+    return typed
+
+
+def scan(name: str, cache_dir: Path | None = None) -> pl.LazyFrame:
+    return pl.scan_ipc(materialize(name, cache_dir), memory_map=True)
+
+
+def load(name: str, cache_dir: Path | None = None) -> pl.DataFrame:
+    return scan(name, cache_dir).collect()
@@ -0,0 +1,224 @@
+"""
+CSV -> partitioned Parquet ingestion for the `scan_csv` sources.
+
+The lazy examples start from `pl.scan_csv(f_name)`, so every run parses
+text and infers the schema again, and predicate / projection pushdown can
+only skip work after the text has been parsed. Ingesting a CSV once
+gives:
+
+* a persisted schema (inferred once, with any `dtypes` overrides such as
+  the Categorical columns of 6_aggregation.py) that later `scan_csv`
+  calls reuse instead of re-inferring;
+* a columnar copy: Parquet files with row-group statistics, optionally
+  split into one directory per value of a partition column, so filters
+  skip whole files / row groups and only the selected columns are read.
+
+    q = ingest.scan_csv(f_name).filter(pl.col("sepal_length") > 5)
+
+is a drop-in for `pl.scan_csv(f_name)`. The copy is keyed by the CSV's
+path, size and mtime plus the ingest options, so editing the CSV (or
+changing the options) produces a fresh copy. A `transform` is keyed by its
+code, so editing it does too; editing a helper it calls does not.
+"""
+import ast
+import functools
+import hashlib
+import json
+import shutil
+import tempfile
+import types
+from pathlib import Path
+from typing import Callable
+
+import polars as pl
+
+from learn_polars.datasets import fetch
+from learn_polars.paths import default_cache_dir
+
+SCHEMA_FILE = "schema.json"
+
+
+def dtype_to_str(dtype: pl.PolarsDataType) -> str:
+    return str(dtype)
+
+
+def _dtype_node(node: ast.AST):
+    if isinstance(node, ast.Name):
+        value = getattr(pl, node.id, None)
+        if value is pl.Field or (isinstance(value, type) and issubclass(value, pl.DataType)):
+            return value
+        raise ValueError(f"{node.id!r} is not a polars dtype")
+    if isinstance(node, ast.Call):
+        return _dtype_node(node.func)(
+            *(_dtype_node(arg) for arg in node.args),
+            **{kw.arg: _dtype_node(kw.value) for kw in node.keywords},
+        )
+    if isinstance(node, ast.List):
+        return [_dtype_node(v) for v in node.elts]
+    # the parameters: time units, time zones, field names
+    return ast.literal_eval(node)
+
+
+def dtype_from_str(name: str) -> pl.PolarsDataType:
+    """
+    The dtype `dtype_to_str` wrote, e.g. "Int64" or
+    "Datetime(time_unit='us', time_zone=None)". Names are looked up on the
+    polars module and only dtypes (and struct `Field`s) are called; nothing
+    is evaluated.
+    """
+    return _dtype_node(ast.parse(name, mode="eval").body)
+
+
+def _fingerprint(path: Path, **options) -> str:
+    stat = path.stat()
+    spec = {"path": str(path.resolve()), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, **options}
+    return hashlib.sha256(json.dumps(spec, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def _code_key(code: types.CodeType) -> list:
+    consts = [_code_key(c) if isinstance(c, types.CodeType) else repr(c) for c in code.co_consts]
+    return [code.co_code.hex(), consts, code.co_names]
+
+
+def _transform_key(transform: Callable | None) -> str | None:
+    """
+    A hash of what `transform` does: its bytecode, constants and the names
+    it uses, plus its defaults and closure values. Not the name: editing a
+    transform keeps its `__qualname__` but has to give a new copy.
+    """
+    if transform is None:
+        return None
+    if isinstance(transform, functools.partial):
+        spec = [_transform_key(transform.func), repr(transform.args), repr(sorted(transform.keywords.items()))]
+    elif hasattr(transform, "__code__"):
+        cells = [repr(c.cell_contents) for c in transform.__closure__ or ()]
+        spec = [_code_key(transform.__code__), repr(transform.__defaults__), cells]
+    elif hasattr(getattr(transform, "__call__", None), "__code__"):
+        # a callable object: its method and its state
+        spec = [_transform_key(transform.__call__), repr(getattr(transform, "__dict__", None))]
+    else:
+        # builtins have no bytecode and don't change
+        spec = [transform.__module__, transform.__qualname__]
+    return hashlib.sha256(json.dumps(spec).encode()).hexdigest()[:16]
+
+
+def _dtypes_key(dtypes: dict[str, pl.PolarsDataType] | None) -> dict[str, str]:
+    return {k: dtype_to_str(v) for k, v in (dtypes or {}).items()}
+
+
+def infer_schema(
+    path: str | Path,
+    dtypes: dict[str, pl.PolarsDataType] | None = None,
+    infer_schema_length: int | None = 10_000,
+    cache_dir: Path | None = None,
+) -> dict[str, pl.PolarsDataType]:
+    """
+    Infer the schema of a CSV once and cache it; `dtypes` overrides the
+    inferred type of individual columns.
+    """
+    path = Path(path)
+    key = _fingerprint(path, dtypes=_dtypes_key(dtypes), infer_schema_length=infer_schema_length)
+    cached = (cache_dir or default_cache_dir()) / "ingest" / "schemas" / f"{key}.json"
+    if cached.exists():
+        return {k: dtype_from_str(v) for k, v in json.loads(cached.read_text()).items()}
+
+    schema = pl.scan_csv(path, dtypes=dtypes, infer_schema_length=infer_schema_length).schema
+    cached.parent.mkdir(parents=True, exist_ok=True)
+    cached.write_text(json.dumps({k: dtype_to_str(v) for k, v in schema.items()}, indent=2))
+    return dict(schema)
+
+
+def _storage_dtype(dtype: pl.PolarsDataType) -> pl.PolarsDataType:
+    # batches are written independently, so a Categorical would get a
+    # different dictionary in every file; store the strings and cast on scan
+    return pl.Utf8 if dtype == pl.Categorical else dtype
+
+
+def ingest(
+    path: str | Path,
+    dtypes: dict[str, pl.PolarsDataType] | None = None,
+    transform: Callable[[pl.DataFrame], pl.DataFrame] | None = None,
+    partition_by: str | None = None,
+    row_group_size: int = 128 * 1024,
+    batch_size: int = 1_000_000,
+    cache_dir: Path | None = None,
+) -> Path:
+    """
+    Convert the CSV at `path` to Parquet in a single streaming pass and
+    return the output directory. `transform` is applied per batch and must
+    be row-wise (e.g. parsing a date column).
+    """
+    path = Path(path)
+    key = _fingerprint(
+        path,
+        dtypes=_dtypes_key(dtypes),
+        transform=_transform_key(transform),
+        partition_by=partition_by,
+        row_group_size=row_group_size,
+    )
+    target = (cache_dir or default_cache_dir()) / "ingest" / "parquet" / f"{path.stem}-{key}"
+    if target.exists():
+        return target
+
+    csv_schema = infer_schema(path, dtypes, cache_dir=cache_dir)
+    read_dtypes = {k: _storage_dtype(v) for k, v in csv_schema.items()}
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(dir=target.parent, prefix=".tmp-"))
+    try:
+        reader = pl.read_csv_batched(path, dtypes=read_dtypes, batch_size=batch_size)
+        schema = None
+        i = 0
+        while batches := reader.next_batches(1):
+            for batch in batches:
+                if transform is not None:
+                    batch = transform(batch)
+                schema = schema or batch.schema
+                parts = batch.partition_by(partition_by, as_dict=True) if partition_by else {None: batch}
+                for value, part in parts.items():
+                    out = tmp / f"{partition_by}={value}" if partition_by else tmp
+                    out.mkdir(exist_ok=True)
+                    part.write_parquet(out / f"part-{i:05d}.parquet", statistics=True, row_group_size=row_group_size)
+                i += 1
+        if schema is None:
+            raise ValueError(f"{path} contains no rows")
+        # dtypes the user asked for win over what the batches were stored as
+        final = dict(schema) | {k: v for k, v in csv_schema.items() if v == pl.Categorical}
+        meta = {
+            "source": str(path.resolve()),
+            "partition_by": partition_by,
+            "schema": {k: dtype_to_str(v) for k, v in final.items()},
+        }
+        (tmp / SCHEMA_FILE).write_text(json.dumps(meta, indent=2))
+        tmp.rename(target)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return target
+
+
+def scan_ingested(directory: str | Path) -> pl.LazyFrame:
+    """Scan an ingested directory, restoring the dtypes recorded at ingest time."""
+    directory = Path(directory)
+    meta = json.loads((directory / SCHEMA_FILE).read_text())
+    pattern = "*/*.parquet" if meta["partition_by"] else "*.parquet"
+    lf = pl.scan_parquet(directory / pattern, use_statistics=True)
+    schema = {k: dtype_from_str(v) for k, v in meta["schema"].items()}
+    casts = [pl.col(k).cast(v) for k, v in schema.items() if lf.schema[k] != v]
+    return lf.with_columns(casts).select(list(schema)) if casts else lf.select(list(schema))
+
+
+def scan_csv(path: str | Path, **kwargs) -> pl.LazyFrame:
+    """Drop-in for `pl.scan_csv(path)` that scans the (cached) columnar copy."""
+    return scan_ingested(ingest(path, **kwargs))
+
+
+def scan_dataset(name: str, partition_by: str | None = None, cache_dir: Path | None = None) -> pl.LazyFrame:
+    """Ingest one of the fetched datasets (see fetch.SOURCES) with its dtypes and transform."""
+    source = fetch.SOURCES[name]
+    directory = ingest(
+        fetch.fetch(name, cache_dir),
+        dtypes=source.dtypes,
+        transform=source.transform,
+        partition_by=partition_by,
+        cache_dir=cache_dir,
+    )
+    return scan_ingested(directory)
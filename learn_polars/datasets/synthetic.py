@@ -0,0 +1,275 @@
+"""
+Schema-faithful synthetic versions of the datasets used by the examples.
+
+`data/iris.csv` has 150 rows and the pokemon / legislators CSVs are tiny
+downloads, so scaling experiments generate look-alike data instead: the
+same column names and dtypes, any number of rows and configurable
+cardinalities for the grouping columns.
+
+Generated data is written in chunks by a thread pool (numpy and polars
+both release the GIL for the heavy lifting) and cached on disk as a
+directory of Parquet or IPC files keyed by (schema, rows, seed,
+cardinality). A second request for the same data is just a scan.
+
+    lf = synthetic.scan("legislators", 10_000_000)
+    df = synthetic.load("iris", 1_000_000, cardinality={"species": 30})
+"""
+import hashlib
+import json
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import polars as pl
+
+from learn_polars.paths import default_cache_dir
+
+# bump when a generator changes so stale caches are not reused
+VERSION = 1
+
+SPECIES = ["Iris-setosa", "Iris-versicolor", "Iris-virginica"]
+POKEMON_TYPES = [
+    "Bug", "Dragon", "Electric", "Fairy", "Fighting", "Fire", "Flying", "Ghost",
+    "Grass", "Ground", "Ice", "Normal", "Poison", "Psychic", "Rock", "Water",
+]
+STATES = [
+    "AL", "AK", "AZ", "AR", "CA", "CO", "CT", "DE", "FL", "GA", "HI", "ID", "IL",
+    "IN", "IA", "KS", "KY", "LA", "ME", "MD", "MA", "MI", "MN", "MS", "MO", "MT",
+    "NE", "NV", "NH", "NJ", "NM", "NY", "NC", "ND", "OH", "OK", "OR", "PA", "RI",
+    "SC", "SD", "TN", "TX", "UT", "VT", "VA", "WA", "WV", "WI", "WY",
+]
+PARTIES = ["Democrat", "Republican", "Whig", "Federalist", "Anti-Administration", "Pro-Administration"]
+
+
+# Column helpers. `rng` is the generator for one chunk, `offset` the index
+# of the chunk's first row in the full dataset.
+
+
+def _pool(values: list[str], cardinality: int, prefix: str) -> list[str]:
+    # the real values first, then made up ones if more are requested
+    return values[:cardinality] + [f"{prefix}{i}" for i in range(len(values), cardinality)]
+
+
+def _pick(rng: np.random.Generator, values: list[str], n_rows: int) -> pl.Series:
+    return pl.Series(values).take(pl.Series(rng.integers(0, len(values), n_rows)))
+
+
+def _names(rng: np.random.Generator, prefix: str, n_rows: int, cardinality: int) -> pl.Series:
+    ids = pl.Series(rng.integers(0, cardinality, n_rows))
+    return pl.select(pl.lit(prefix) + pl.lit(ids).cast(pl.Utf8)).to_series()
+
+
+def _stations(offset: int, n_rows: int) -> pl.Series:
+    return pl.select(pl.format("Station {}", pl.arange(offset + 1, offset + n_rows + 1))).to_series()
+
+
+# Generators: (rng, offset, n_rows, cardinality) -> DataFrame
+
+
+def _iris(rng: np.random.Generator, offset: int, n_rows: int, card: dict[str, int]) -> pl.DataFrame:
+    return pl.DataFrame(
+        {
+            "sepal_length": rng.normal(5.8, 0.8, n_rows).round(1),
+            "sepal_width": rng.normal(3.0, 0.4, n_rows).round(1),
+            "petal_length": rng.normal(3.8, 1.7, n_rows).round(1),
+            "petal_width": rng.normal(1.2, 0.7, n_rows).round(1),
+            "species": _pick(rng, _pool(SPECIES, card["species"], "Iris-"), n_rows),
+        }
+    )
+
+
+def _pokemon(rng: np.random.Generator, offset: int, n_rows: int, card: dict[str, int]) -> pl.DataFrame:
+    types = _pool(POKEMON_TYPES, card["Type 1"], "Type")
+    return pl.DataFrame(
+        {
+            "#": np.arange(offset + 1, offset + n_rows + 1, dtype=np.int64),
+            "Name": _names(rng, "Mon", n_rows, card["Name"]),
+            "Type 1": _pick(rng, types, n_rows),
+            "Type 2": _pick(rng, types, n_rows),
+            "Total": rng.integers(180, 780, n_rows),
+            "HP": rng.integers(1, 255, n_rows),
+            "Attack": rng.integers(5, 190, n_rows),
+            "Defense": rng.integers(5, 230, n_rows),
+            "Sp. Atk": rng.integers(10, 194, n_rows),
+            "Sp. Def": rng.integers(20, 230, n_rows),
+            "Speed": rng.integers(5, 180, n_rows),
+            "Generation": rng.integers(1, 7, n_rows),
+            "Legendary": rng.random(n_rows) < 0.08,
+        }
+    )
+
+
+def _legislators(rng: np.random.Generator, offset: int, n_rows: int, card: dict[str, int]) -> pl.DataFrame:
+    # days since the unix epoch for birthdays between 1720 and 2000
+    low, high = (date(1720, 1, 1) - date(1970, 1, 1)).days, (date(2000, 1, 1) - date(1970, 1, 1)).days
+    return pl.DataFrame(
+        {
+            "id": pl.Series(np.arange(offset, offset + n_rows), dtype=pl.UInt32),
+            "last_name": _names(rng, "Last", n_rows, card["last_name"]),
+            "first_name": _names(rng, "First", n_rows, card["first_name"]),
+            "birthday": pl.Series(rng.integers(low, high, n_rows), dtype=pl.Int32).cast(pl.Date),
+            "gender": pl.Series(np.where(rng.random(n_rows) < 0.9, "M", "F")),
+            "type": pl.Series(np.where(rng.random(n_rows) < 0.8, "rep", "sen")),
+            "state": _pick(rng, _pool(STATES, card["state"], "S"), n_rows),
+            "party": _pick(rng, _pool(PARTIES, card["party"], "Party"), n_rows),
+        }
+    )
+
+
+def _mixed(rng: np.random.Generator, offset: int, n_rows: int, card: dict[str, int]) -> pl.DataFrame:
+    nrs = pl.Series("nrs", rng.integers(0, 100, n_rows))
+    return pl.DataFrame(
+        {
+            "nrs": nrs.set_at_idx(np.flatnonzero(rng.random(n_rows) < 0.1), None),
+            "names": _names(rng, "name", n_rows, card["names"]),
+            "random": rng.random(n_rows),
+            "groups": _pick(rng, _pool(["A", "B", "C"], card["groups"], "G"), n_rows),
+        }
+    )
+
+
+def _urls(rng: np.random.Generator, offset: int, n_rows: int, card: dict[str, int]) -> pl.DataFrame:
+    # ~5% of the rows carry the `candidat=` typo from 5_strings.py
+    key = pl.Series(np.where(rng.random(n_rows) < 0.05, "candidat", "candidate"))
+    candidate = _names(rng, "player", n_rows, card["candidate"])
+    url = pl.format("http://vote.com/ballon_dor?{}={}&ref=polars", pl.lit(key), pl.lit(candidate))
+    return pl.select(url.alias("a"))
+
+
+def _temperatures(rng: np.random.Generator, offset: int, n_rows: int, card: dict[str, int]) -> pl.DataFrame:
+    # space separated readings where roughly one token in ten is an `E<n>` error code
+    readings = [
+        pl.when(pl.lit(pl.Series(rng.random(n_rows) < 0.1)))
+        .then(pl.lit("E") + pl.lit(pl.Series(rng.integers(0, 10, n_rows))).cast(pl.Utf8))
+        .otherwise(pl.lit(pl.Series(rng.integers(0, 40, n_rows))).cast(pl.Utf8))
+        for _ in range(card["tokens"])
+    ]
+    return pl.select(
+        _stations(offset, n_rows).alias("station"),
+        pl.concat_str(readings, separator=" ").alias("temperatures"),
+    )
+
+
+def _wide(rng: np.random.Generator, offset: int, n_rows: int, card: dict[str, int]) -> pl.DataFrame:
+    return pl.DataFrame(
+        [_stations(offset, n_rows).alias("station")]
+        + [pl.Series(f"day_{i}", rng.integers(0, 30, n_rows)) for i in range(1, card["days"] + 1)]
+    )
+
+
+@dataclass(frozen=True)
+class Schema:
+    generate: Callable[[np.random.Generator, int, int, dict[str, int]], pl.DataFrame]
+    # distinct values per column (or shape parameters like `tokens`); overridable per call
+    cardinality: dict[str, int]
+    # casts applied on load, e.g. the Categorical dtypes of 6_aggregation.py.
+    # Chunks are stored without them so that files written independently
+    # can be scanned together.
+    dtypes: dict[str, pl.PolarsDataType] = field(default_factory=dict)
+
+
+SCHEMAS: dict[str, Schema] = {
+    "iris": Schema(_iris, {"species": 3}),
+    "pokemon": Schema(_pokemon, {"Name": 800, "Type 1": 16}),
+    "legislators": Schema(
+        _legislators,
+        {"first_name": 2_000, "last_name": 20_000, "state": 50, "party": 6},
+        {c: pl.Categorical for c in ("first_name", "gender", "type", "state", "party")},
+    ),
+    "mixed": Schema(_mixed, {"names": 1_000, "groups": 3}),
+    "urls": Schema(_urls, {"candidate": 500}),
+    "temperatures": Schema(_temperatures, {"tokens": 10}),
+    "wide": Schema(_wide, {"days": 3}),
+}
+
+
+def _schema(name: str) -> Schema:
+    try:
+        return SCHEMAS[name]
+    except KeyError:
+        raise KeyError(f"unknown dataset {name!r}, choose from {sorted(SCHEMAS)}") from None
+
+
+def cache_key(name: str, n_rows: int, seed: int = 0, cardinality: dict[str, int] | None = None) -> str:
+    """Stable key for (schema, rows, seed); the schema includes its cardinalities and output dtypes."""
+    schema = _schema(name)
+    card = schema.cardinality | (cardinality or {})
+    sample = schema.generate(np.random.default_rng(0), 0, 1, card)
+    spec = {
+        "name": name,
+        "version": VERSION,
+        "schema": {k: str(v) for k, v in sample.schema.items()},
+        "cardinality": sorted(card.items()),
+        "rows": n_rows,
+        "seed": seed,
+    }
+    digest = hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:16]
+    return f"{name}-{n_rows}-{seed}-{digest}"
+
+
+def generate(
+    name: str,
+    n_rows: int,
+    seed: int = 0,
+    cardinality: dict[str, int] | None = None,
+    *,
+    fmt: str = "parquet",
+    chunk_rows: int = 1_000_000,
+    workers: int | None = None,
+    cache_dir: Path | None = None,
+) -> Path:
+    """
+    Generate `n_rows` rows of dataset `name` and return the cache
+    directory holding its chunk files. Cached data is returned as is.
+    """
+    if fmt not in ("parquet", "ipc"):
+        raise ValueError(f"fmt must be 'parquet' or 'ipc', got {fmt!r}")
+    schema = _schema(name)
+    card = schema.cardinality | (cardinality or {})
+    target = (cache_dir or default_cache_dir()) / "synthetic" / f"{cache_key(name, n_rows, seed, cardinality)}.{fmt}"
+    if target.exists():
+        return target
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(dir=target.parent, prefix=".tmp-"))
+    starts = range(0, max(n_rows, 1), chunk_rows)
+
+    def write_chunk(i: int, start: int) -> None:
+        # one independent stream per chunk, so the output does not depend on scheduling
+        rng = np.random.default_rng([seed, i])
+        df = schema.generate(rng, start, min(chunk_rows, n_rows - start), card)
+        path = tmp / f"part-{i:05d}.{fmt}"
+        df.write_parquet(path) if fmt == "parquet" else df.write_ipc(path)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(write_chunk, range(len(starts)), starts))
+        try:
+            tmp.rename(target)
+        except OSError:
+            # another process generated the same data concurrently
+            if not target.exists():
+                raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return target
+
+
+def scan(name: str, n_rows: int, seed: int = 0, cardinality: dict[str, int] | None = None, **kwargs) -> pl.LazyFrame:
+    """Lazily scan the (cached) dataset with the schema's dtypes applied."""
+    path = generate(name, n_rows, seed, cardinality, **kwargs)
+    if path.suffix == ".ipc":
+        lf = pl.scan_ipc(path / "*.ipc")
+    else:
+        lf = pl.scan_parquet(path / "*.parquet")
+    dtypes = _schema(name).dtypes
+    return lf.with_columns([pl.col(c).cast(t) for c, t in dtypes.items()]) if dtypes else lf
+
+
+def load(name: str, n_rows: int, seed: int = 0, cardinality: dict[str, int] | None = None, **kwargs) -> pl.DataFrame:
+    return scan(name, n_rows, seed, cardinality, **kwargs).collect()
@@ -0,0 +1,162 @@
+"""
+Shrink a frame's dtypes to the narrowest lossless ones.
+
+expressions/4_casting.py downcasts by hand (`cast(pl.Int16)`,
+`cast(pl.Float32)`) and shows a strict cast failing on overflow.
+`optimize_dtypes(frame)` picks the types from the data instead. One
+aggregation pass (streaming for a LazyFrame) collects per column the
+min / max, null count, whether every float survives a round trip through
+Float32, and the approximate number of distinct strings. Then
+
+* integers get the narrowest signed type holding [min, max] (unsigned
+  too with `allow_unsigned=True`; off by default since unsigned
+  subtraction wraps);
+* Float64 becomes Float32 only when no value changes;
+* with `categorical_ratio` set, strings with few distinct values (that
+  fraction of the rows or less) become Categorical. This is opt-in: the
+  values stay the same, but Categoricals sort and compare by their
+  physical (first-seen) order rather than lexically, so `sort` and
+  `<` / `>` give different results. This polars version has no Enum type.
+
+Frames cast to Categorical separately must be combined under
+`pl.StringCache()`.
+
+    df, report = optimize_dtypes(df)
+    print(report)
+"""
+from dataclasses import dataclass, field
+
+import numpy as np
+import polars as pl
+
+_SIGNED = [pl.Int8, pl.Int16, pl.Int32, pl.Int64]
+_UNSIGNED = [pl.UInt8, pl.UInt16, pl.UInt32, pl.UInt64]
+_INTEGERS = _SIGNED + _UNSIGNED
+_WIDTHS = {
+    **{dtype: np.dtype(dtype.__name__.lower()).itemsize for dtype in _INTEGERS},
+    pl.Float32: 4,
+    pl.Float64: 8,
+    pl.Date: 4,
+    pl.Datetime: 8,
+    pl.Duration: 8,
+}
+
+
+@dataclass
+class DtypeReport:
+    changes: dict[str, tuple[pl.PolarsDataType, pl.PolarsDataType]] = field(default_factory=dict)
+    bytes_before: int = 0
+    bytes_after: int = 0
+    # LazyFrames are not materialized: sizes are computed from the column statistics
+    estimated: bool = False
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.bytes_before - self.bytes_after
+
+    @property
+    def ratio(self) -> float:
+        return self.bytes_before / self.bytes_after if self.bytes_after else float("inf")
+
+    def __str__(self) -> str:
+        approx = "~" if self.estimated else ""
+        lines = [
+            f"{len(self.changes)} columns recast, {approx}{self.bytes_before / 2**20:.1f} MiB -> "
+            f"{approx}{self.bytes_after / 2**20:.1f} MiB ({self.ratio:.1f}x smaller)"
+        ]
+        lines += [f"  {name}: {old} -> {new}" for name, (old, new) in self.changes.items()]
+        return "\n".join(lines)
+
+
+def _fits(dtype: pl.PolarsDataType, lo: int, hi: int) -> bool:
+    info = np.iinfo(dtype.__name__.lower())
+    return info.min <= lo and hi <= info.max
+
+
+def _statistics(lf: pl.LazyFrame, schema: dict[str, pl.PolarsDataType], streaming: bool) -> dict:
+    aggs = [pl.count().alias("__rows")]
+    for name, dtype in schema.items():
+        col = pl.col(name)
+        aggs.append(col.null_count().alias(f"{name}__nulls"))
+        if dtype in _INTEGERS:
+            aggs += [col.min().alias(f"{name}__min"), col.max().alias(f"{name}__max")]
+        elif dtype == pl.Float64:
+            same = (col.cast(pl.Float32).cast(pl.Float64) == col) | col.is_nan()
+            aggs.append(same.fill_null(True).all().alias(f"{name}__f32"))
+        elif dtype == pl.Utf8:
+            aggs += [col.approx_unique().alias(f"{name}__unique"), col.str.lengths().sum().alias(f"{name}__bytes")]
+    return lf.select(aggs).collect(streaming=streaming).row(0, named=True)
+
+
+def _narrowest(
+    name: str,
+    dtype: pl.PolarsDataType,
+    stats: dict,
+    categorical_ratio: float | None,
+    allow_unsigned: bool,
+) -> pl.PolarsDataType:
+    rows = stats["__rows"]
+    if dtype in _INTEGERS:
+        lo, hi = stats[f"{name}__min"], stats[f"{name}__max"]
+        if lo is None:
+            return dtype
+        candidates = (_UNSIGNED if allow_unsigned and lo >= 0 else []) + _SIGNED
+        fitting = [c for c in candidates if _fits(c, lo, hi)]
+        if not fitting:
+            # a UInt64 above the Int64 max without `allow_unsigned`
+            return dtype
+        best = min(fitting, key=lambda c: _WIDTHS[c])
+        return best if _WIDTHS[best] < _WIDTHS[dtype] else dtype
+    if dtype == pl.Float64 and stats[f"{name}__f32"]:
+        return pl.Float32
+    if dtype == pl.Utf8 and categorical_ratio is not None and rows:
+        if stats[f"{name}__unique"] <= categorical_ratio * rows:
+            return pl.Categorical
+    return dtype
+
+
+def _estimated_bytes(name: str, dtype: pl.PolarsDataType, source: pl.PolarsDataType, stats: dict) -> int:
+    rows = stats["__rows"]
+    validity = rows // 8 if stats[f"{name}__nulls"] else 0
+    if dtype == pl.Utf8:
+        return stats[f"{name}__bytes"] + 8 * (rows + 1) + validity
+    if dtype == pl.Categorical and source == pl.Utf8:
+        unique = stats[f"{name}__unique"]
+        present = rows - stats[f"{name}__nulls"]
+        dictionary = stats[f"{name}__bytes"] * unique // present if present else 0
+        return 4 * rows + dictionary + 8 * (unique + 1) + validity
+    if dtype == pl.Categorical:
+        # the dictionary of an existing Categorical isn't in the statistics
+        return 4 * rows + validity
+    if dtype == pl.Boolean:
+        return rows // 8 + validity
+    return _WIDTHS.get(dtype, 0) * rows + validity
+
+
+def optimize_dtypes(
+    frame: pl.DataFrame | pl.LazyFrame,
+    categorical_ratio: float | None = None,
+    allow_unsigned: bool = False,
+) -> tuple[pl.DataFrame | pl.LazyFrame, DtypeReport]:
+    """Cast every column of `frame` to its narrowest lossless dtype; returns the frame and a report."""
+    lazy = isinstance(frame, pl.LazyFrame)
+    lf = frame.lazy()
+    schema = dict(lf.schema)
+    stats = _statistics(lf, schema, streaming=lazy)
+
+    report = DtypeReport(estimated=lazy)
+    for name, dtype in schema.items():
+        target = _narrowest(name, dtype, stats, categorical_ratio, allow_unsigned)
+        if target != dtype:
+            report.changes[name] = (dtype, target)
+        if lazy:
+            report.bytes_before += _estimated_bytes(name, dtype, dtype, stats)
+            report.bytes_after += _estimated_bytes(name, target, dtype, stats)
+
+    casts = [pl.col(name).cast(new) for name, (_, new) in report.changes.items()]
+    if lazy:
+        return lf.with_columns(casts), report
+    out = frame.with_columns(casts)
+    report.bytes_before = frame.estimated_size()
+    report.bytes_after = out.estimated_size()
+    return out, report
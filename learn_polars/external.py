@@ -0,0 +1,303 @@
+"""
+Out-of-core sort and groupby, spilling to IPC files under a memory budget.
+
+The `sort("birthday", descending=True).groupby("state").agg(...)` queries of
+expressions/6_aggregation.py need the whole frame in memory at once. Both
+helpers here first write the input to an uncompressed IPC file (with
+`sink_ipc` for a LazyFrame, so a streamable plan never materializes) and
+then read it back memory-mapped, one batch of rows at a time:
+
+* `run_partitioned(source, "state", query)` hash-partitions every batch on
+  the key columns into per-partition spill files, runs `query` on one
+  partition at a time and concatenates the results. Every group lands in
+  exactly one partition, so any query that works group by group (a
+  groupby on those keys, with sorts and filters before it) gives the same
+  rows as on the whole frame; partitions are sized so that the query on
+  one of them fits the budget. A single group larger than that can't be
+  split and still has to fit.
+* `sort(source, "birthday", descending=True)` is an external merge sort:
+  every batch is sorted and written as a run, and the runs are merged
+  k-way, a block of each at a time. Each round emits every buffered row
+  up to the smallest "last row of a block" among the runs that have more
+  rows on disk, since no row still on disk can sort before it. When there
+  are too many runs for blocks of a useful size, groups of them are first
+  merged into longer runs, in as many passes as it takes. The result is
+  written as numbered IPC parts and returned as a LazyFrame over them.
+
+The budget counts three copies of whatever is in memory at once (the input
+of a step, its output and the row indices in between), as measured for
+sorts and groupbys in `learn_polars.streaming`. Spill files go under
+`<cache>/spill` and are removed afterwards unless `directory=` is given.
+
+    out, report = external.run_partitioned(
+        pl.scan_ipc(path), "state",
+        lambda lf: lf.sort("birthday", descending=True).groupby("state").agg(pl.first("last_name")),
+        memory_budget_bytes=2**30,
+    )
+"""
+import math
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterator, Sequence
+
+import polars as pl
+
+from learn_polars.paths import default_cache_dir
+
+_PART = "__partition"
+# copies of the rows in memory during a step (input, output, indices)
+_COPIES = 3
+# smallest block of a run worth a merge round; more runs get an extra pass
+_MIN_BLOCK_ROWS = 1024
+
+
+@dataclass
+class SpillReport:
+    input_rows: int = 0
+    input_bytes: int = 0
+    memory_budget_bytes: int = 0
+    batches: int = 0
+    # hash partitions for run_partitioned, sorted runs for sort
+    partitions: int = 0
+    # merge passes over the sorted runs (sort only)
+    merge_passes: int = 0
+    spilled_files: int = 0
+    spilled_bytes: int = 0
+    seconds: float = 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.input_rows:,} rows ({self.input_bytes / 2**20:,.1f} MiB) under a "
+            f"{self.memory_budget_bytes / 2**20:,.1f} MiB budget: {self.batches} batches, "
+            f"{self.partitions} partitions, "
+            + (f"{self.merge_passes} merge passes, " if self.merge_passes else "")
+            + f"{self.spilled_files} spill files "
+            f"({self.spilled_bytes / 2**20:,.1f} MiB) in {self.seconds:.2f}s"
+        )
+
+
+@contextmanager
+def _spill_directory(directory: str | Path | None) -> Iterator[Path]:
+    if directory is not None:
+        path = Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        yield path
+        return
+    root = default_cache_dir() / "spill"
+    root.mkdir(parents=True, exist_ok=True)
+    path = Path(tempfile.mkdtemp(dir=root))
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _write(df: pl.DataFrame, path: Path, report: SpillReport) -> Path:
+    # uncompressed, so that it can be read back memory-mapped
+    df.write_ipc(path, compression="uncompressed")
+    report.spilled_files += 1
+    report.spilled_bytes += path.stat().st_size
+    return path
+
+
+def _categoricals(source: pl.DataFrame | pl.LazyFrame) -> list[str]:
+    return [name for name, dtype in source.schema.items() if dtype == pl.Categorical]
+
+
+def _spill_input(source: pl.DataFrame | pl.LazyFrame, directory: Path, report: SpillReport) -> pl.DataFrame:
+    """The input as a memory-mapped DataFrame backed by an IPC file in `directory`."""
+    path = directory / "input.ipc"
+    if isinstance(source, pl.DataFrame):
+        source.write_ipc(path, compression="uncompressed")
+    else:
+        source.sink_ipc(path, compression=None)
+    df = pl.read_ipc(path, memory_map=True, rechunk=False)
+    report.input_rows = df.height
+    report.input_bytes = path.stat().st_size
+    return df
+
+
+def _batch_rows(report: SpillReport, budget: int, buffers: int = 1) -> int:
+    row_bytes = max(1, report.input_bytes // max(1, report.input_rows))
+    return max(1, budget // (_COPIES * row_bytes * buffers))
+
+
+def _batches(df: pl.DataFrame, rows: int) -> Iterator[pl.DataFrame]:
+    for offset in range(0, df.height, rows):
+        # zero-copy slices of the memory-mapped file
+        yield df.slice(offset, rows)
+
+
+def run_partitioned(
+    source: pl.DataFrame | pl.LazyFrame,
+    by: str | Sequence[str],
+    query: Callable[[pl.LazyFrame], pl.LazyFrame],
+    memory_budget_bytes: int,
+    n_partitions: int | None = None,
+    directory: str | Path | None = None,
+) -> tuple[pl.DataFrame, SpillReport]:
+    """
+    `query` over `source`, run one hash partition of the `by` columns at a
+    time; the per-partition results are concatenated in partition order.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    report = SpillReport(memory_budget_bytes=memory_budget_bytes)
+    start = time.perf_counter()
+    # one dictionary for the Categorical columns of all spill files
+    with _spill_directory(directory) as spill, pl.StringCache():
+        df = _spill_input(source, spill, report)
+        n = n_partitions or max(1, math.ceil(_COPIES * report.input_bytes / memory_budget_bytes))
+        report.partitions = n
+
+        files: dict[int, list[Path]] = defaultdict(list)
+        partition = (pl.struct(by).hash(seed=0) % n).alias(_PART)
+        for i, batch in enumerate(_batches(df, _batch_rows(report, memory_budget_bytes))):
+            report.batches += 1
+            pieces = batch.with_columns(partition).partition_by(_PART, as_dict=True)
+            for p, piece in pieces.items():
+                files[p].append(_write(piece.drop(_PART), spill / f"part-{p:05d}-{i:07d}.ipc", report))
+
+        # read, not memory-mapped: the results must not point into the spill files
+        scans = {p: pl.concat([pl.scan_ipc(f, memory_map=False) for f in files[p]]) for p in sorted(files)}
+        results = [query(lf).collect() for lf in scans.values()] or [query(df.clear().lazy()).collect()]
+        out = pl.concat(results, rechunk=False)
+        del df
+    report.seconds = time.perf_counter() - start
+    return out, report
+
+
+def _at_or_before(by: list[str], descending: list[bool], nulls_last: bool, bound: dict) -> pl.Expr:
+    """Rows that sort at or before `bound`, spelled out key by key (nulls sort as the smallest value)."""
+    expr = None
+    for key, desc in reversed(list(zip(by, descending))):
+        col, value = pl.col(key), bound[key]
+        nulls_first = not desc and not nulls_last
+        if value is None:
+            before = pl.lit(False) if nulls_first else col.is_not_null()
+            equal = col.is_null()
+        else:
+            after = col > value if desc else col < value
+            before = (col.is_null() | after) if nulls_first else after
+            equal = col == value
+        before, equal = before.fill_null(False), equal.fill_null(False)
+        expr = before | equal if expr is None else before | (equal & expr)
+    return expr
+
+
+def _sorted(df: pl.DataFrame, by: list[str], descending: list[bool], nulls_last: bool) -> pl.DataFrame:
+    if not nulls_last:
+        return df.sort(by, descending=descending)
+    # polars' own nulls_last doesn't order the rows that are null in one key by
+    # the keys after it: sort on an is-null key in front of every key instead
+    keys = [e for key in by for e in (pl.col(key).is_null(), pl.col(key))]
+    return df.sort(keys, descending=[d for desc in descending for d in (False, desc)])
+
+
+def _merge(
+    runs: list[list[Path]],
+    by: list[str],
+    descending: list[bool],
+    nulls_last: bool,
+    budget: int,
+    report: SpillReport,
+) -> Iterator[pl.DataFrame]:
+    """K-way merge of sorted `runs`, yielding the merged rows in order, a few blocks at a time."""
+    readers = [pl.concat([pl.read_ipc(f, memory_map=True, rechunk=False) for f in run], rechunk=False) for run in runs]
+    # a block of every run in memory at a time, and as much again for the
+    # merged rows waiting to be written
+    block = _batch_rows(report, budget, buffers=2 * max(1, len(runs)))
+    write_rows = block * len(runs)
+    offsets = [0] * len(readers)
+    buffers = [reader.clear() for reader in readers]
+    waiting: list[pl.DataFrame] = []
+    while True:
+        for i, reader in enumerate(readers):
+            if buffers[i].is_empty() and offsets[i] < reader.height:
+                buffers[i] = reader.slice(offsets[i], block)
+                offsets[i] += block
+        if all(b.is_empty() for b in buffers):
+            break
+        # runs with rows still on disk limit how far this round may go
+        pending = [b.tail(1) for b, o, r in zip(buffers, offsets, readers) if o < r.height]
+        if pending:
+            bound = _sorted(pl.concat(pending), by, descending, nulls_last).row(0, named=True)
+            keep = _at_or_before(by, descending, nulls_last, bound)
+            emit = [b.filter(keep) for b in buffers]
+            buffers = [b.filter(~keep) for b in buffers]
+        else:
+            emit, buffers = buffers, [b.clear() for b in buffers]
+        waiting.append(_sorted(pl.concat([e for e in emit if not e.is_empty()]), by, descending, nulls_last))
+        if sum(w.height for w in waiting) >= write_rows:
+            yield pl.concat(waiting)
+            waiting.clear()
+    if waiting:
+        yield pl.concat(waiting)
+
+
+def sort(
+    source: pl.DataFrame | pl.LazyFrame,
+    by: str | Sequence[str],
+    memory_budget_bytes: int,
+    descending: bool | Sequence[bool] = False,
+    nulls_last: bool = False,
+    output: str | Path | None = None,
+    directory: str | Path | None = None,
+) -> tuple[pl.LazyFrame, SpillReport]:
+    """
+    `source.sort(by, descending=..., nulls_last=...)` as an external merge
+    sort. The sorted rows are written to numbered IPC files in `output`
+    (by default `<cache>/sorted/<unique name>`) and returned as a scan of them.
+    Categorical keys are sorted by their strings, not by their physical order.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    descending = [descending] * len(by) if isinstance(descending, bool) else list(descending)
+    report = SpillReport(memory_budget_bytes=memory_budget_bytes)
+    if output is None:
+        (default_cache_dir() / "sorted").mkdir(parents=True, exist_ok=True)
+        output = tempfile.mkdtemp(dir=default_cache_dir() / "sorted")
+    output = Path(output)
+    output.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+
+    # every part would get its own Categorical dictionary: spill strings
+    categoricals = _categoricals(source)
+    source = source.with_columns(pl.col(categoricals).cast(pl.Utf8)) if categoricals else source
+    with _spill_directory(directory) as spill:
+        df = _spill_input(source, spill, report)
+        # a run is a list of files, read back-to-back
+        runs: list[list[Path]] = []
+        for i, batch in enumerate(_batches(df, _batch_rows(report, memory_budget_bytes))):
+            report.batches += 1
+            runs.append([_write(_sorted(batch, by, descending, nulls_last), spill / f"run-{i:05d}.ipc", report)])
+        report.partitions = len(runs)
+
+        # merge at most `fan_in` runs at a time, so that blocks stay large
+        # enough to be worth a round; earlier passes write longer runs
+        fan_in = max(2, _batch_rows(report, memory_budget_bytes, buffers=2) // _MIN_BLOCK_ROWS)
+        while len(runs) > fan_in:
+            report.merge_passes += 1
+            longer = []
+            for g in range(0, len(runs), fan_in):
+                merged = _merge(runs[g : g + fan_in], by, descending, nulls_last, memory_budget_bytes, report)
+                name = f"run-{report.merge_passes}-{g // fan_in:05d}"
+                longer.append([_write(m, spill / f"{name}-{k:07d}.ipc", report) for k, m in enumerate(merged)])
+            for path in (f for run in runs for f in run):
+                path.unlink()
+            runs = longer
+
+        report.merge_passes += 1
+        parts = 0
+        for parts, merged in enumerate(_merge(runs, by, descending, nulls_last, memory_budget_bytes, report), 1):
+            merged.write_ipc(output / f"part-{parts - 1:07d}.ipc", compression="uncompressed")
+        if parts == 0:
+            df.clear().write_ipc(output / "part-0000000.ipc", compression="uncompressed")
+        del df
+    report.seconds = time.perf_counter() - start
+    # the parts are named in order and a glob scan reads them in name order
+    out = pl.scan_ipc(output / "part-*.ipc")
+    return (out.with_columns(pl.col(categoricals).cast(pl.Categorical)) if categoricals else out), report
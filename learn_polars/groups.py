@@ -0,0 +1,192 @@
+"""
+Group indices computed once per frame and key set, and reused by later
+groupby / over queries.
+
+8_window_functions.py notes that the groups of an `over` are cached, but
+only within one `select`: every new query over the same frame hashes the
+keys again. A `GroupCache` keeps, per key set,
+
+* the key tuples of the groups, in order of first appearance;
+* the row numbers ordered by group (the rows of group 0, then group 1,
+  ...), and the group id of every row.
+
+A `groupby` on the cache gathers the columns the aggregations use in that
+order and groups them by the sorted group id, which polars splits into
+groups by slicing instead of hashing the keys again. String columns cost
+more to gather than to group, so those are grouped on the (unsorted)
+group ids instead: one integer key rather than the original keys. An
+`over` aggregates the same way and gathers the per-group values back to
+the rows (or, for a value per row, explodes them and puts the rows back in
+frame order).
+
+The gain is in hashing the keys: a single Categorical key is already
+grouped on its integer codes and gains little, several keys or String
+keys gain most (on 5M legislator rows, a groupby on first_name and state
+took ~0.1s from the cache against ~1s).
+
+The cache holds on to the frame. Replacing it with `update(df)` drops all
+indices, and so does any change to the frame that every lookup notices:
+its height, the key columns' dtypes and, for numeric and Categorical
+keys, their buffers (`replace`, `df[i, "k"] = v`, `extend`, ...). A
+String key edited in place at the same length isn't noticed unless
+`verify=True`, which hashes the key columns on every lookup.
+
+    cache = GroupCache(df)
+    by_type = cache.groupby("Type 1", pl.col("Attack").mean())
+    df.with_columns(cache.over("Type 1", pl.col("Defense").mean().alias("avg_defense")))
+    print(cache)  # hits / misses
+"""
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Sequence
+
+import numpy as np
+import polars as pl
+
+_GROUP = "__group"
+_ROW_NR = "__row_nr"
+_VARIABLE_WIDTH = {pl.Utf8, pl.Binary, pl.List, pl.Struct, pl.Object}
+
+
+@dataclass
+class GroupIndex:
+    keys: list[str]
+    # one row per group with its key values, in order of first appearance
+    groups: pl.DataFrame
+    # row numbers ordered by group, in frame order within a group
+    order: pl.Series
+    # the group id of every row, in frame order
+    group_ids: pl.Series
+    # the group ids of the rows in `order`, flagged sorted
+    sorted_ids: pl.Series
+    # rows per group
+    sizes: pl.Series
+
+    @cached_property
+    def inverse(self) -> pl.Series:
+        """The position of every row in `order`: puts rows gathered by `order` back in frame order."""
+        inverse = np.empty(len(self.order), dtype=np.uint32)
+        inverse[self.order.to_numpy()] = np.arange(len(self.order), dtype=np.uint32)
+        return pl.Series(_ROW_NR, inverse)
+
+    @property
+    def n_groups(self) -> int:
+        return self.groups.height
+
+    def __str__(self) -> str:
+        return f"{self.keys}: {self.n_groups:,} groups over {len(self.order):,} rows"
+
+
+def build_index(df: pl.DataFrame, keys: Sequence[str]) -> GroupIndex:
+    """The `GroupIndex` of `df` for `keys`, with one groupby."""
+    keys = list(keys)
+    rows = df.select(keys).with_row_count(_ROW_NR).groupby(keys, maintain_order=True).agg(pl.col(_ROW_NR))
+    lengths = rows.get_column(_ROW_NR).list.lengths().to_numpy()
+    order = rows.get_column(_ROW_NR).explode()
+    sorted_ids = np.repeat(np.arange(rows.height, dtype=np.uint32), lengths)
+    group_ids = np.empty(df.height, dtype=np.uint32)
+    group_ids[order.to_numpy()] = sorted_ids
+    return GroupIndex(
+        keys,
+        rows.drop(_ROW_NR),
+        order,
+        pl.Series(_GROUP, group_ids),
+        pl.Series(_GROUP, sorted_ids).set_sorted(),
+        pl.Series("sizes", lengths),
+    )
+
+
+@dataclass
+class GroupCache:
+    frame: pl.DataFrame
+    # hash the key columns on every lookup, to notice in-place edits of String keys
+    verify: bool = False
+    hits: int = 0
+    misses: int = 0
+    invalidations: int = 0
+    _indices: dict[tuple[str, ...], tuple[tuple, GroupIndex]] = field(default_factory=dict, repr=False)
+
+    def _fingerprint(self, keys: tuple[str, ...]) -> tuple:
+        parts: list = [self.frame.height]
+        for key in keys:
+            s = self.frame.get_column(key)
+            parts.append(s.dtype)
+            physical = s.to_physical()
+            parts.append(physical._get_ptr() if physical.is_numeric() and s.n_chunks() == 1 else s.n_chunks())
+            if self.verify:
+                parts.append(s.hash(seed=0).sum())
+        return tuple(parts)
+
+    def update(self, df: pl.DataFrame) -> None:
+        """Replace the frame; every cached index is dropped."""
+        self.frame = df
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        if self._indices:
+            self.invalidations += 1
+        self._indices.clear()
+
+    def index(self, by: str | Sequence[str]) -> GroupIndex:
+        """The group index for `by`, from the cache or built and cached."""
+        keys = (by,) if isinstance(by, str) else tuple(by)
+        fingerprint = self._fingerprint(keys)
+        cached = self._indices.get(keys)
+        if cached is not None and cached[0] == fingerprint:
+            self.hits += 1
+            return cached[1]
+        if cached is not None:
+            # the frame changed under the cache: no index can be trusted
+            self.invalidate()
+        self.misses += 1
+        index = build_index(self.frame, keys)
+        self._indices[keys] = (fingerprint, index)
+        return index
+
+    def _aggregate(self, index: GroupIndex, exprs: Sequence[pl.Expr]) -> pl.DataFrame:
+        """`exprs` aggregated per group of `index`, one row per group in group order."""
+        names: set[str] = set()
+        for expr in exprs:
+            if expr.meta.has_multiple_outputs():
+                # as in a groupby, a wildcard doesn't include the keys
+                names.update(c for c in self.frame.columns if c not in index.keys)
+            else:
+                names.update(expr.meta.root_names())
+        columns = [c for c in self.frame.columns if c in names]
+        if any(self.frame.schema[c] in _VARIABLE_WIDTH for c in columns):
+            # gathering strings costs more than grouping them by the cached ids
+            source = self.frame.select(columns).with_columns(index.group_ids)
+        else:
+            # sorted ids: the groups are slices of the gathered rows
+            source = self.frame.select(pl.col(columns).take(index.order)).with_columns(index.sorted_ids)
+        # group ids are numbered in order of first appearance
+        return source.groupby(_GROUP, maintain_order=True).agg(exprs).drop(_GROUP)
+
+    def groupby(self, by: str | Sequence[str], *aggs: pl.Expr) -> pl.DataFrame:
+        """`frame.groupby(by, maintain_order=True).agg(aggs)` on the cached index."""
+        index = self.index(by)
+        return pl.concat([index.groups, self._aggregate(index, aggs)], how="horizontal")
+
+    def over(self, by: str | Sequence[str], *exprs: pl.Expr) -> pl.DataFrame:
+        """
+        The columns of `frame.select(expr.over(by) for expr in exprs)` on the
+        cached index: a value per group is repeated on its rows, a value per
+        row of the group goes back to that row.
+        """
+        index = self.index(by)
+        out = self._aggregate(index, exprs)
+        expected = self.frame.lazy().select(exprs).schema
+        columns = []
+        for s in out.get_columns():
+            if s.dtype == expected[s.name]:
+                columns.append(s.take(index.group_ids))
+                continue
+            if not (s.list.lengths() == index.sizes).all():
+                raise ValueError(f"{s.name!r} doesn't give one value per row of every group; use groupby")
+            columns.append(s.explode().take(index.inverse))
+        return pl.DataFrame(columns)
+
+    def __str__(self) -> str:
+        lines = [f"{self.hits} hits, {self.misses} misses, {self.invalidations} invalidations"]
+        lines += [f"  {index}" for _, index in self._indices.values()]
+        return "\n".join(lines)
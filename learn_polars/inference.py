@@ -0,0 +1,120 @@
+"""
+Batched NumPy bridge for running a model over a column.
+
+expressions/11_user_defined_functions.py passes the whole column to the
+model in one `map` call (`MyNeuralNetwork.forward(s.to_numpy())`): the
+conversion may copy, the dtype is whatever the column has, and the
+model's intermediates are allocated for every row at once.
+`map_batches(s, model)` instead
+
+* casts the column once to the dtype the model wants and hands it out
+  as fixed-size, contiguous, read-only NumPy views of the Arrow buffers
+  (no copy per batch; batches never span two chunks);
+* optionally runs the batches on a thread pool, which pays off when the
+  model spends its time in code that releases the GIL (NumPy matmuls,
+  most inference runtimes);
+* writes every batch's output into one preallocated array that becomes
+  the result Series, without touching individual elements in Python.
+
+    out = df.with_columns(inference.predict(pl.col("features"), model.forward, batch_size=8192).alias("y"))
+"""
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Iterator
+
+import numpy as np
+import polars as pl
+
+Model = Callable[[np.ndarray], np.ndarray]
+
+_POLARS_DTYPES = {
+    np.dtype(np.float32): pl.Float32,
+    np.dtype(np.float64): pl.Float64,
+    np.dtype(np.int8): pl.Int8,
+    np.dtype(np.int16): pl.Int16,
+    np.dtype(np.int32): pl.Int32,
+    np.dtype(np.int64): pl.Int64,
+    np.dtype(np.uint8): pl.UInt8,
+    np.dtype(np.uint16): pl.UInt16,
+    np.dtype(np.uint32): pl.UInt32,
+    np.dtype(np.uint64): pl.UInt64,
+}
+
+
+def _prepare(s: pl.Series, dtype: np.dtype | None, fill_null: float | None) -> pl.Series:
+    if s.null_count():
+        if fill_null is None:
+            raise ValueError(f"{s.name!r} has {s.null_count()} nulls; pass fill_null= to run the model on it")
+        s = s.fill_null(fill_null)
+    if dtype is not None:
+        target = _POLARS_DTYPES.get(np.dtype(dtype))
+        if target is None:
+            raise TypeError(f"unsupported model dtype {dtype}, choose from {sorted(map(str, _POLARS_DTYPES))}")
+        if s.dtype != target:
+            s = s.cast(target)
+    return s
+
+
+def batches(
+    s: pl.Series,
+    batch_size: int,
+    dtype: np.dtype | None = None,
+    fill_null: float | None = None,
+) -> Iterator[tuple[int, np.ndarray]]:
+    """`(offset, view)` for consecutive batches of at most `batch_size` rows of `s`."""
+    s = _prepare(s, dtype, fill_null)
+    offset = 0
+    for chunk in s.get_chunks():
+        values = chunk.to_numpy(zero_copy_only=True)
+        for start in range(0, len(values), batch_size):
+            view = values[start : start + batch_size]
+            yield offset + start, view
+        offset += len(values)
+
+
+def map_batches(
+    s: pl.Series,
+    model: Model,
+    batch_size: int = 65_536,
+    dtype: np.dtype | None = np.float32,
+    fill_null: float | None = None,
+    workers: int = 1,
+) -> pl.Series:
+    """
+    Run `model` over `s` in batches and return its outputs as a Series named
+    like `s`. The model gets a 1-d array and returns one value (or one row
+    of values, which become a list column) per input row.
+    """
+    if len(s) == 0:
+        return _prepare(s, dtype, fill_null)
+    parts = batches(s, batch_size, dtype, fill_null)
+
+    def call(view: np.ndarray) -> np.ndarray:
+        result = np.asarray(model(view))
+        if len(result) != len(view):
+            raise ValueError(f"model returned {len(result)} rows for a batch of {len(view)}")
+        return result
+
+    def run(part: tuple[int, np.ndarray]) -> None:
+        offset, view = part
+        out[offset : offset + len(view)] = call(view)
+
+    # the first batch tells the output dtype and row shape
+    _, view = next(parts)
+    first = call(view)
+    out = np.empty((len(s), *first.shape[1:]), dtype=first.dtype)
+    out[: len(view)] = first
+
+    if workers > 1:
+        with ThreadPoolExecutor(workers) as pool:
+            for _ in pool.map(run, parts):
+                pass
+    else:
+        for part in parts:
+            run(part)
+    return pl.Series(s.name, out)
+
+
+def predict(expr: pl.Expr, model: Model, return_dtype: pl.PolarsDataType | None = None, **kwargs) -> pl.Expr:
+    """`map_batches` as an expression: `expr.map(...)` with the batching applied."""
+    return expr.map(partial(map_batches, model=model, **kwargs), return_dtype=return_dtype)
@@ -0,0 +1,68 @@
+"""
+Parse delimited string columns into typed lists and count what didn't
+parse, without `list.eval`.
+
+expressions/10_lists_and_arrays.py counts the sensor errors with
+
+    pl.col("temperatures").str.split(" ")
+    .list.eval(pl.element().cast(pl.Int64, strict=False).is_null())
+    .list.sum()
+
+`list.eval` runs a sub-query per row and materializes a list of booleans
+only to sum it, and the parsed values need a second `list.eval` that
+splits and casts again. `parse(frame, column)` gets both from one split:
+
+* casting the `List[str]` to `List[Int64]` with `strict=False` parses the
+  flat values buffer in one go, tokens that don't parse become null;
+* `list.count_match(None)` counts those nulls per row over the offsets,
+  without a boolean list.
+
+The counts are the same as with `list.eval` (null strings stay null, an
+empty string is one token that doesn't parse). The two steps run as
+separate `with_columns`, since this polars version doesn't reuse the
+split within a select. On 1M rows of 20 tokens that took 1.5s against
+3.7s for the two `list.eval`s.
+
+Most of the remaining time and memory is the split's `List[str]`: on 10M
+rows of 20 tokens it peaked at ~4.5 GiB (the `list.eval`s didn't fit in
+5 GiB). A DataFrame is parsed in slices of `batch_rows` rows, so that
+only one slice's strings are split at a time (~2.7 GiB, in the same
+13s); a LazyFrame gets the two steps added to its plan.
+
+A NumPy tokenizer over the raw bytes of the column was tried as well:
+even without the split it was ~3x slower than polars' split and cast.
+
+    weather = lists.parse(weather, "temperatures")
+    weather.sort("temperatures_errors", descending=True)
+"""
+import polars as pl
+
+
+def _parse(frame: pl.DataFrame | pl.LazyFrame, column: str, dtype: pl.PolarsDataType, separator: str, name: str):
+    values, errors = f"{name}_values", f"{name}_errors"
+    return frame.with_columns(
+        pl.col(column).str.split(separator).cast(pl.List(dtype), strict=False).alias(values)
+    ).with_columns(pl.col(values).list.count_match(None).alias(errors))
+
+
+def parse(
+    frame: pl.DataFrame | pl.LazyFrame,
+    column: str,
+    dtype: pl.PolarsDataType = pl.Int64,
+    separator: str = " ",
+    name: str | None = None,
+    batch_rows: int = 1_000_000,
+) -> pl.DataFrame | pl.LazyFrame:
+    """
+    Add `<name>_values`, the `separator` delimited tokens of `column` cast to
+    `dtype` (null where they don't parse), and `<name>_errors`, the number of
+    such tokens per row. `name` defaults to `column`.
+    """
+    name = name or column
+    if isinstance(frame, pl.LazyFrame):
+        return _parse(frame, column, dtype, separator, name)
+    parts = [
+        _parse(frame.slice(offset, batch_rows), column, dtype, separator, name)
+        for offset in range(0, max(frame.height, 1), batch_rows)
+    ]
+    return pl.concat(parts, rechunk=False)
@@ -0,0 +1,7 @@
+import os
+from pathlib import Path
+
+
+def default_cache_dir() -> Path:
+    """Root of every on-disk cache in learn_polars; override with LEARN_POLARS_CACHE."""
+    return Path(os.environ.get("LEARN_POLARS_CACHE", Path.home() / ".cache" / "learn_polars"))
@@ -0,0 +1,328 @@
+"""
+Which parts of a LazyFrame stream, and will the rest fit in memory?
+
+concepts/6_streaming_api.py calls `collect(streaming=True)` as if the
+whole plan streamed. Polars only streams the operators its streaming
+engine supports and silently runs the others (`over`, `median`, Python
+UDFs, ...) in memory on the complete input. `coverage(lf, n_rows)` reads
+the plan from `explain(streaming=True)` and marks every node as
+
+* stream: processed batch by batch, memory doesn't grow with the input;
+* sink: a streaming operator that keeps state: a groupby its groups, a
+  sort or unique its input (the sort may spill to disk), a join its
+  right-hand side;
+* memory: runs on the in-memory engine, holding its whole input and its
+  output at once.
+
+The peak is estimated per node as rows x bytes per row of the data
+flowing into it, times the copies the node holds at once (measured: 3
+for an in-memory node or a sort), taken as the largest node. Rows are the input rows
+(`n_rows`, or the row estimates of the scanned files), kept through
+filters (so the estimate errs on the high side) and reduced to `groups`
+by aggregations. Bytes per row come from the scanned columns: file
+schemas are read again from the files, columns of in-memory frames are
+counted as 8 bytes (pass `bytes_per_row=` to override both). It is a
+rough model to refuse plans that clearly won't fit, not a measurement.
+
+    report = streaming.coverage(lf, n_rows=500_000_000)
+    print(report)
+    df = streaming.collect(lf, budget_bytes=8 * 2**30)  # raises MemoryBudgetError
+"""
+import json
+import re
+from dataclasses import dataclass, field
+
+import polars as pl
+
+_START = "--- PIPELINE"
+_END = "--- END PIPELINE"
+
+_SCANS = {"CSV SCAN": pl.scan_csv, "PARQUET SCAN": pl.scan_parquet, "IPC SCAN": pl.scan_ipc}
+_NODE = re.compile(
+    r"(?P<name>DF \[|(?:CSV SCAN|PARQUET SCAN|IPC SCAN|ANONYMOUS SCAN|PYTHON SCAN|FILTER|SELECT|FAST_PROJECT"
+    r"|WITH_COLUMNS|AGGREGATE|SORT BY|UNIQUE|SLICE|CACHE|UNION|[A-Z]+ JOIN|EXPLODE|MELT|RENAME"
+    r"|WITH ROW COUNT|UNNEST|DROP_NULLS|FAST COUNT|python dataframe udf|MAP_FUNCTION|EXTERNAL_CONTEXT)\b)"
+)
+# streaming operators whose state grows with their input
+_SINKS = ("AGGREGATE", "SORT BY", "UNIQUE", "JOIN")
+_PROJECTED = re.compile(r"PROJECT (\*|\d+)/(\d+) COLUMNS")
+_COLUMN = re.compile(r'col\("([^"]+)"\)')
+_FAST_PROJECT = re.compile(r"FAST_PROJECT: \[([^\]]*)\]")
+# copies of a node's input held at its peak, from RSS measured on the iris
+# CSV scaled to 15M rows: a sort or in-memory groupby also holds row
+# indices and its gathered output, a join its hash table
+_COPIES = {"memory": 3, "SORT BY": 3, "UNIQUE": 2, "JOIN": 2, "AGGREGATE": 2}
+_WIDTHS = {
+    pl.Boolean: 1,
+    pl.Int8: 1,
+    pl.UInt8: 1,
+    pl.Int16: 2,
+    pl.UInt16: 2,
+    pl.Int32: 4,
+    pl.UInt32: 4,
+    pl.Float32: 4,
+    pl.Date: 4,
+    pl.Categorical: 4,
+}
+
+
+class MemoryBudgetError(MemoryError):
+    """The estimated peak memory of a plan exceeds the budget."""
+
+
+@dataclass
+class PlanNode:
+    name: str
+    line: str
+    depth: int
+    # "stream", "sink" or "memory"
+    engine: str
+    rows: int = 0
+    bytes_per_row: int = 0
+    estimated_bytes: int = 0
+    children: list["PlanNode"] = field(default_factory=list, repr=False)
+    # for joins: the children that make up the right-hand side
+    right: list["PlanNode"] = field(default_factory=list, repr=False)
+
+
+@dataclass
+class StreamingReport:
+    nodes: list[PlanNode]
+    plan: str
+    n_rows: int | None = None
+
+    @property
+    def coverage(self) -> str:
+        """"full", "partial" or "none"."""
+        return streaming_coverage(self.plan)
+
+    @property
+    def in_memory(self) -> list[PlanNode]:
+        return [node for node in self.nodes if node.engine == "memory"]
+
+    @property
+    def peak_bytes(self) -> int:
+        return max((node.estimated_bytes for node in self.nodes), default=0)
+
+    def fits(self, budget_bytes: int) -> bool:
+        return self.peak_bytes <= budget_bytes
+
+    def __str__(self) -> str:
+        rows = f" at {self.n_rows:,} input rows" if self.n_rows is not None else ""
+        lines = [f"streaming: {self.coverage}, estimated peak ~{self.peak_bytes / 2**20:,.1f} MiB{rows}"]
+        for node in self.nodes:
+            size = f"~{node.estimated_bytes / 2**20:,.1f} MiB" if node.estimated_bytes else ""
+            lines.append(f"  {node.engine:<6} {size:>14}  {' ' * node.depth}{node.line.strip()}")
+        return "\n".join(lines)
+
+
+def streaming_coverage(plan: str) -> str:
+    """
+    Classify a plan printed by `explain(streaming=True)`.
+
+    Polars wraps the part of the plan it can stream in a
+    `--- PIPELINE ... --- END PIPELINE` block. Anything printed above
+    that block runs on the in-memory engine on top of the pipeline.
+    """
+    if _START not in plan:
+        return "none"
+    above = plan.split(_START, 1)[0]
+    return "partial" if above.strip() else "full"
+
+
+def _indent(line: str) -> int:
+    return len(line) - len(line.lstrip())
+
+
+def _parse(plan: str) -> tuple[list[PlanNode], list[PlanNode]]:
+    """The nodes of a plan printed by `explain(streaming=True)`, top down, and the roots among them."""
+    nodes: list[PlanNode] = []
+    roots: list[PlanNode] = []
+    in_pipeline, offset = False, 0
+    # joins whose right-hand side is being printed
+    right_side: list[PlanNode] = []
+    for line in plan.splitlines():
+        if line.strip() == _START:
+            # the pipeline is printed from column 0 again, in place of a subtree
+            in_pipeline, offset = True, _indent(line)
+            continue
+        text = line.replace(_END, "")
+        stripped = text.strip()
+        depth = _indent(text) + (offset if in_pipeline else 0)
+        match = _NODE.match(stripped)
+        if stripped.startswith("DF []"):
+            # the placeholder the pipeline's output is written into
+            pass
+        elif stripped.startswith("RIGHT PLAN ON") and nodes:
+            join = next(n for n in reversed(nodes) if "JOIN" in n.name)
+            right_side.append(join)
+        elif stripped.startswith("END ") and "JOIN" in stripped and right_side:
+            right_side.pop()
+        elif match:
+            name = match.group("name").rstrip(" [")
+            engine = "memory"
+            if in_pipeline:
+                engine = "sink" if any(sink in name for sink in _SINKS) else "stream"
+            node = PlanNode(name, stripped, depth, engine)
+            parent = next((n for n in reversed(nodes) if n.depth < depth), None)
+            if parent is None:
+                roots.append(node)
+            else:
+                parent.children.append(node)
+                if right_side and right_side[-1] is parent:
+                    parent.right.append(node)
+            nodes.append(node)
+        elif nodes and _PROJECTED.search(stripped):
+            # a file scan's projection is printed on the next line
+            nodes[-1].line += " " + _PROJECTED.search(stripped).group(0)
+        if _END in line:
+            in_pipeline, offset = False, 0
+    return nodes, roots
+
+
+def _value_bytes(dtype: pl.PolarsDataType, string_bytes: int) -> int:
+    if dtype in (pl.Utf8, pl.Binary, pl.Object) or isinstance(dtype, (pl.List, pl.Struct)):
+        # the values plus an 8 byte offset
+        return string_bytes + 8
+    return _WIDTHS.get(dtype, 8)
+
+
+def _referenced(plan: str, output: list[str]) -> set[str]:
+    """Column names the plan mentions: a file scan's projection is printed as a count only."""
+    names = set(_COLUMN.findall(plan)) | set(output)
+    for listed in _FAST_PROJECT.findall(plan):
+        names.update(name.strip() for name in listed.split(","))
+    return names
+
+
+def _scan_bytes(node: PlanNode, referenced: set[str], string_bytes: int) -> int:
+    projected = _PROJECTED.search(node.line)
+    columns = None
+    if projected is not None and projected.group(1) != "*":
+        columns = int(projected.group(1))
+    if node.name in _SCANS:
+        path = node.line[len(node.name) :].split(" PROJECT")[0].strip()
+        try:
+            schema = _SCANS[node.name](path).schema
+        except Exception:
+            schema = None
+        if schema:
+            widths = {name: _value_bytes(dtype, string_bytes) for name, dtype in schema.items()}
+            read = [name for name in widths if name in referenced]
+            if columns is None:
+                return sum(widths.values())
+            if len(read) == columns:
+                return sum(widths[name] for name in read)
+            return sum(widths.values()) * columns // len(widths)
+    if columns is None and projected is not None:
+        columns = int(projected.group(2))
+    return 8 * (columns or 1)
+
+
+def _file_rows(lf: pl.LazyFrame) -> dict[str, int]:
+    """The row estimates polars keeps for the scanned files, by path."""
+    try:
+        tree = json.loads(lf.write_json())
+    except Exception:
+        return {}
+    rows = {}
+
+    def walk(node) -> None:
+        if isinstance(node, dict):
+            info = node.get("file_info")
+            if "path" in node and isinstance(info, dict):
+                known, estimate = info.get("row_estimation", [None, None])
+                rows[str(node["path"])] = known if known is not None else estimate
+            for value in node.values():
+                walk(value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value)
+
+    walk(tree)
+    return rows
+
+
+def _estimate(
+    node: PlanNode,
+    n_rows: int | None,
+    file_rows: dict[str, int],
+    groups: int | None,
+    bytes_per_row: int | None,
+    referenced: set[str],
+    string_bytes: int,
+) -> None:
+    for child in node.children:
+        _estimate(child, n_rows, file_rows, groups, bytes_per_row, referenced, string_bytes)
+    children = node.children
+    if not children:
+        if n_rows is not None:
+            node.rows = n_rows
+        else:
+            path = node.line[len(node.name) :].split(" PROJECT")[0].strip()
+            if path not in file_rows or file_rows[path] is None:
+                raise ValueError(f"no row count for {node.line!r}; pass n_rows=")
+            node.rows = file_rows[path]
+        node.bytes_per_row = bytes_per_row or _scan_bytes(node, referenced, string_bytes)
+    elif node.name == "UNION":
+        node.rows = sum(c.rows for c in children)
+        node.bytes_per_row = max(c.bytes_per_row for c in children)
+    elif "JOIN" in node.name:
+        left = [c for c in children if c not in node.right]
+        node.rows = max((c.rows for c in left), default=0)
+        if node.name.startswith("CROSS"):
+            node.rows *= max((c.rows for c in node.right), default=1)
+        node.bytes_per_row = sum(c.bytes_per_row for c in children)
+    else:
+        node.rows = max(c.rows for c in children)
+        node.bytes_per_row = max(c.bytes_per_row for c in children)
+
+    if node.engine == "memory":
+        node.estimated_bytes = _COPIES["memory"] * node.rows * node.bytes_per_row
+    elif node.engine == "sink" and "JOIN" in node.name:
+        node.estimated_bytes = _COPIES["JOIN"] * sum(c.rows * c.bytes_per_row for c in node.right)
+    elif node.engine == "sink" and node.name == "AGGREGATE":
+        node.estimated_bytes = _COPIES["AGGREGATE"] * min(node.rows, groups or node.rows) * node.bytes_per_row
+    elif node.engine == "sink":
+        node.estimated_bytes = _COPIES[node.name] * node.rows * node.bytes_per_row
+
+    if node.name == "AGGREGATE":
+        node.rows = 1 if "BY [] FROM" in node.line else min(node.rows, groups or node.rows)
+
+
+def coverage(
+    lf: pl.LazyFrame,
+    n_rows: int | None = None,
+    groups: int | None = None,
+    bytes_per_row: int | None = None,
+    string_bytes: int = 16,
+) -> StreamingReport:
+    """
+    Mark every node of `lf`'s streaming plan and estimate the peak memory at
+    `n_rows` input rows (per scan; by default the file's own row count).
+    `groups` is the expected number of groups of its aggregations.
+    """
+    plan = lf.explain(streaming=True, common_subplan_elimination=False)
+    nodes, roots = _parse(plan)
+    file_rows = _file_rows(lf) if n_rows is None else {}
+    referenced = _referenced(plan, lf.columns)
+    for root in roots:
+        _estimate(root, n_rows, file_rows, groups, bytes_per_row, referenced, string_bytes)
+    return StreamingReport(nodes, plan, n_rows)
+
+
+def check(lf: pl.LazyFrame, budget_bytes: int, **kwargs) -> StreamingReport:
+    """`coverage`, raising MemoryBudgetError when the estimated peak exceeds `budget_bytes`."""
+    report = coverage(lf, **kwargs)
+    if not report.fits(budget_bytes):
+        raise MemoryBudgetError(
+            f"estimated peak ~{report.peak_bytes / 2**20:,.0f} MiB exceeds the budget of "
+            f"{budget_bytes / 2**20:,.0f} MiB\n{report}"
+        )
+    return report
+
+
+def collect(lf: pl.LazyFrame, budget_bytes: int, **kwargs) -> pl.DataFrame:
+    """`lf.collect(streaming=True)` after a pre-flight `check` against `budget_bytes`."""
+    check(lf, budget_bytes, **kwargs)
+    return lf.collect(streaming=True, common_subplan_elimination=False)
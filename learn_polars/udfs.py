@@ -0,0 +1,525 @@
+"""
+Find `map` / `apply` UDFs in a lazy query and replace the ones that have
+a native equivalent.
+
+expressions/11_user_defined_functions.py shows
+`pl.col("values").map(lambda s: s.shift())` in a groupby: it holds the
+GIL, and because `map` sees the whole column before it is grouped, it
+shifts values across group boundaries. `rewrite(lf)` walks the plan,
+finds every Python callable in it and, for `map` / `apply` expressions,
+tries to express the callable natively:
+
+* the callable is called once on a placeholder `pl.col(...)` instead of a
+  Series (or, for `apply` in a select, instead of a single value); if it
+  only uses methods and operators that Series and Expr share (`shift`,
+  `cumsum`, `abs`, `+`, `*`, comparisons, ...) the result is the
+  equivalent expression;
+* `apply` in a select must stay elementwise, so there only expressions
+  without group-aware functions (`shift`, `cumsum`, aggregations) qualify;
+* a `map` in a groupby becomes a per-group expression, which is what it
+  was meant to be; the report notes the change in results.
+
+The callable is traced without knowing the dtype it will get, so the
+result only stands if it agrees with the callable on the first 1,000 rows
+of its input: `lambda v: v * 2` repeats a string, `lambda v: ~v` is -2 for
+`True`, and `lambda v: v.upper() if isinstance(v, str) else v` traces to
+the identity. If the results differ, or there is no data to check them on
+(`rewrite_expr` without a frame), the UDF stays.
+
+Callables that can't be traced are left alone and reported together with
+an estimate of the Python calls (and time) they still cost per run.
+
+Python's `%` and `//` round differently from polars' (`-2 % 3` is 1 in
+Python, -2 in polars; `1 // 0.1` is 9.0 against 10.0), so callables that
+use them are only rewritten when both operands are non-negative integer
+constants.
+
+Polars 0.18 has no API to walk a plan, so the plan goes through
+`write_json()` / `from_json()`. Polars pickles the callables in it by
+looking up `pickle.dumps` / `pickle.loads` on every call, so while a plan
+is walked those two point to a private `Pickler` / `Unpickler` pair that
+stores the callables in a registry (`persistent_id`) instead of pickling
+them. Only calls from the walking thread are diverted; any other thread
+gets the original functions. An in-memory DataFrame would be serialized with
+the plan, slowly and not exactly, so queries on in-memory data are built
+on the `batch.track` recorder instead and their expressions are rewritten
+one by one:
+
+    q = batch.track(df).groupby("keys").agg(pl.col("values").map(lambda s: s.shift()))
+    lf, report = udfs.rewrite(q)
+    print(report)
+"""
+import inspect
+import io
+import json
+import pickle
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
+from typing import Any, Callable, Iterator
+
+import polars as pl
+
+from learn_polars import batch
+
+_INPUT = "__udf_input"
+# rows of a UDF's input a rewrite is checked against
+_SAMPLE_ROWS = 1_000
+# what polars puts before the pickled callable in a serialized plan
+_UDF_PREFIX = b"POLARS_PYTHON_UDF"
+_lock = threading.RLock()
+
+# expression nodes that can't change the number or order of rows
+_ELEMENTWISE = {"Column", "Literal", "BinaryExpr", "Cast", "Function", "Ternary", "Alias"}
+# Python floors `%` and `//`, polars truncates `%` and floors `a / b` for `//`
+_ROUNDING = {"Modulus", "FloorDivide"}
+
+
+class _Pickler(pickle.Pickler):
+    """Pickles the object it is given as a reference into `registry`."""
+
+    def __init__(self, file, registry: list, root: Any, **kwargs):
+        super().__init__(file, **kwargs)
+        self.registry = registry
+        self.root = root
+
+    def persistent_id(self, obj: Any) -> int | None:
+        if obj is not self.root:
+            return None
+        self.registry.append(obj)
+        return len(self.registry) - 1
+
+
+class _Unpickler(pickle.Unpickler):
+    def __init__(self, file, registry: list, **kwargs):
+        super().__init__(file, **kwargs)
+        self.registry = registry
+        # the registry indexes loaded
+        self.loaded: list[int] = []
+
+    def persistent_load(self, pid: int) -> Any:
+        self.loaded.append(pid)
+        return self.registry[pid]
+
+
+@contextmanager
+def capture() -> Iterator[list]:
+    """While active, polars (de)serializes the callables of this thread as references into the yielded list."""
+    registry: list = []
+    dumps, loads = pickle.dumps, pickle.loads
+    owner = threading.get_ident()
+
+    def capture(obj, *args, **kwargs):
+        if threading.get_ident() != owner:
+            return dumps(obj, *args, **kwargs)
+        buffer = io.BytesIO()
+        _Pickler(buffer, registry, obj, protocol=kwargs.get("protocol")).dump(obj)
+        return buffer.getvalue()
+
+    def restore(data, *args, **kwargs):
+        if threading.get_ident() != owner:
+            return loads(data, *args, **kwargs)
+        return _Unpickler(io.BytesIO(bytes(data)), registry).load()
+
+    with _lock:
+        pickle.dumps, pickle.loads = capture, restore
+        try:
+            yield registry
+        finally:
+            pickle.dumps, pickle.loads = dumps, loads
+
+
+@lru_cache(maxsize=None)
+def per_call_seconds() -> float:
+    """Measured cost of one Python call from `Series.apply`."""
+    s = pl.Series(range(200_000))
+    start = time.perf_counter()
+    s.apply(lambda v: v)
+    return (time.perf_counter() - start) / len(s)
+
+
+@dataclass
+class UdfNode:
+    # "map", "apply" or "frame" (LazyFrame.map, groupby.apply, ...)
+    kind: str
+    # "select", "groupby" or "window"
+    context: str
+    function: str
+    # the native expression it was replaced by
+    native: str | None = None
+    note: str = ""
+
+    @property
+    def calls_per_row(self) -> float:
+        """Python calls per input row; 1 for an elementwise apply, ~0 for batch calls."""
+        if self.native is not None:
+            return 0.0
+        return 1.0 if self.kind == "apply" and self.context == "select" else 0.0
+
+
+@dataclass
+class UdfReport:
+    nodes: list[UdfNode] = field(default_factory=list)
+    # rows scanned, when the plan only reads in-memory frames
+    n_rows: int | None = None
+
+    @property
+    def rewritten(self) -> list[UdfNode]:
+        return [n for n in self.nodes if n.native is not None]
+
+    @property
+    def remaining(self) -> list[UdfNode]:
+        return [n for n in self.nodes if n.native is None]
+
+    def python_calls(self, n_rows: int) -> int:
+        """Estimated Python calls left per run; a groupby apply is counted as one call per group."""
+        per_row = sum(n.calls_per_row for n in self.remaining)
+        return int(per_row * n_rows) + sum(1 for n in self.remaining if n.calls_per_row == 0)
+
+    def overhead_seconds(self, n_rows: int) -> float:
+        return self.python_calls(n_rows) * per_call_seconds()
+
+    def __str__(self) -> str:
+        lines = [f"{len(self.nodes)} python callables, {len(self.rewritten)} rewritten, {len(self.remaining)} left"]
+        for n in self.nodes:
+            status = f"-> {n.native}" if n.native is not None else "kept"
+            lines.append(f"  {n.kind} in {n.context}: {n.function} {status}" + (f" ({n.note})" if n.note else ""))
+        if self.n_rows is not None and self.remaining:
+            calls = self.python_calls(self.n_rows)
+            per_group = any(n.kind == "apply" and n.context == "groupby" for n in self.remaining)
+            lines.append(
+                f"  ~{calls:,} python calls left for {self.n_rows:,} rows, "
+                f"~{self.overhead_seconds(self.n_rows):.3f}s at {per_call_seconds() * 1e9:.0f}ns per call"
+                + (" (plus one call per group for a groupby apply)" if per_group else "")
+            )
+        return "\n".join(lines)
+
+
+def _name(function: Any) -> str:
+    return getattr(function, "__qualname__", repr(function))
+
+
+def _unwrap_apply(function: Callable) -> Callable | None:
+    """The user's function inside the wrapper `Expr.apply` passes to `map`."""
+    if getattr(function, "__qualname__", "") != "Expr.apply.<locals>.wrap_f":
+        return None
+    return inspect.getclosurevars(function).nonlocals.get("function")
+
+
+def is_elementwise(node: Any) -> bool:
+    if not isinstance(node, dict):
+        return node == "Wildcard"
+    ((kind, value),) = node.items()
+    if kind not in _ELEMENTWISE:
+        return False
+    if kind in ("Column", "Literal"):
+        return True
+    if kind == "Function":
+        return value["options"]["collect_groups"] == "ApplyFlat" and all(is_elementwise(i) for i in value["input"])
+    if kind == "BinaryExpr":
+        return is_elementwise(value["left"]) and is_elementwise(value["right"])
+    if kind == "Cast":
+        return is_elementwise(value["expr"])
+    if kind == "Alias":
+        return is_elementwise(value[0])
+    return all(is_elementwise(value[k]) for k in ("predicate", "truthy", "falsy"))
+
+
+def _contains(node: Any, kind: str) -> bool:
+    if isinstance(node, dict):
+        return kind in node or any(_contains(v, kind) for v in node.values())
+    if isinstance(node, list):
+        return any(_contains(v, kind) for v in node)
+    return False
+
+
+def _substitute(node: Any, replacement: dict) -> Any:
+    if node == {"Column": _INPUT}:
+        return replacement
+    if isinstance(node, dict):
+        return {k: _substitute(v, replacement) for k, v in node.items()}
+    if isinstance(node, list):
+        return [_substitute(v, replacement) for v in node]
+    return node
+
+
+def _non_negative_integer(node: Any) -> bool:
+    if not isinstance(node, dict) or "Literal" not in node or not isinstance(node["Literal"], dict):
+        return False
+    ((dtype, value),) = node["Literal"].items()
+    return "Int" in dtype and isinstance(value, int) and value >= 0
+
+
+def _rounds_differently(node: Any) -> bool:
+    """Whether `node` has a `%` or `//` whose result may differ from Python's."""
+    if isinstance(node, list):
+        return any(_rounds_differently(v) for v in node)
+    if not isinstance(node, dict):
+        return False
+    binary = node.get("BinaryExpr")
+    if isinstance(binary, dict) and binary.get("op") in _ROUNDING:
+        if not (_non_negative_integer(binary["left"]) and _non_negative_integer(binary["right"])):
+            return True
+    return any(_rounds_differently(v) for v in node.values())
+
+
+def trace(function: Callable, elementwise: bool = False) -> pl.Expr | None:
+    """
+    The expression `function` computes when given `pl.col(_INPUT)` instead
+    of a Series, or None if it can't run on an expression (or would still
+    call Python).
+    """
+    try:
+        traced = function(pl.col(_INPUT))
+    except Exception:
+        return None
+    if not isinstance(traced, pl.Expr) or traced.meta.root_names() != [_INPUT]:
+        return None
+    with capture():
+        tree = json.loads(traced.meta.write_json(None))
+    if _contains(tree, "AnonymousFunction") or (elementwise and not is_elementwise(tree)):
+        return None
+    if _rounds_differently(tree):
+        return None
+    return traced
+
+
+def _captured(data: bytes, registry: list) -> int | None:
+    """The index in `registry` of the callable polars serialized as `data`."""
+    start = data.find(b"\x80", len(_UDF_PREFIX)) if data.startswith(_UDF_PREFIX) else -1
+    if start < 0:
+        return None
+    unpickler = _Unpickler(io.BytesIO(data[start:]), registry)
+    try:
+        unpickler.load()
+    except Exception:
+        return None
+    return unpickler.loaded[0] if len(unpickler.loaded) == 1 else None
+
+
+Sampler = Callable[[], "pl.DataFrame | None"]
+
+
+def _sampler(load: Callable[[], pl.LazyFrame] | None) -> Sampler:
+    """The first rows of the frame `load` builds, built once and only when asked for; None if there is none."""
+    cached: list = []
+
+    def sample() -> pl.DataFrame | None:
+        if not cached:
+            try:
+                cached.append(load().head(_SAMPLE_ROWS).collect() if load is not None else None)
+            except Exception:
+                cached.append(None)
+        return cached[0]
+
+    return sample
+
+
+def _numeric(dtype: pl.PolarsDataType) -> bool:
+    return dtype in pl.NUMERIC_DTYPES and dtype != pl.Boolean
+
+
+def _matches(traced: pl.Expr, function: Callable, elementwise: bool, sample: pl.Series) -> bool:
+    """Whether `traced` gives what `function` gives on `sample` (per value for an elementwise apply)."""
+    if len(sample) == 0:
+        # nothing to compare: Python and polars arithmetic agree on numbers
+        return _numeric(sample.dtype)
+    try:
+        expected = sample.apply(function) if elementwise else function(sample)
+        got = pl.DataFrame({_INPUT: sample}).select(traced).to_series()
+    except Exception:
+        return False
+    return isinstance(expected, pl.Series) and expected.series_equal(got.alias(expected.name), null_equal=True)
+
+
+def _input_sample(udf: dict, sample: Sampler) -> pl.Series | None:
+    frame = sample()
+    if frame is None:
+        return None
+    try:
+        return frame.select(pl.Expr.from_json(json.dumps(udf["input"][0]))).to_series()
+    except Exception:
+        return None
+
+
+def _rewrite_node(node: dict, context: str, registry: list, report: UdfReport, seen: set, sample: Sampler) -> dict:
+    udf = node["AnonymousFunction"]
+    index = _captured(bytes(udf["function"]), registry)
+    if index is None:
+        return node
+    seen.add(index)
+    function = registry[index]
+    applied = _unwrap_apply(function)
+    kind = "apply" if applied is not None else "map"
+    entry = UdfNode(kind, context, _name(applied or function))
+    report.nodes.append(entry)
+
+    if context == "window":
+        entry.note = "inside a window, not rewritten"
+        return node
+    if len(udf["input"]) != 1:
+        entry.note = "takes several inputs"
+        return node
+    if kind == "map" and udf["options"]["fmt_str"] != "python_udf":
+        # map(agg_list=True) hands the function a list column
+        entry.note = "agg_list map"
+        return node
+    elementwise = kind == "apply" and context == "select"
+    traced = trace(applied or function, elementwise=elementwise)
+    if traced is None:
+        entry.note = "no native equivalent found"
+        return node
+    # the function was traced without knowing the dtype it gets: `v * 2` repeats a string
+    values = _input_sample(udf, sample)
+    if values is None:
+        entry.note = "no data to check the native equivalent against"
+        return node
+    if not _matches(traced, applied or function, elementwise, values):
+        entry.note = f"native equivalent differs on the {values.dtype} input"
+        return node
+
+    with capture():
+        tree = json.loads(traced.meta.write_json(None))
+    native = _substitute(tree, udf["input"][0])
+    entry.native = str(pl.Expr.from_json(json.dumps(native)))
+    if kind == "map" and context == "groupby":
+        entry.note = "map saw the whole column; the native expression runs per group"
+    return native
+
+
+def _walk(node: Any, context: str, visit: Callable[[dict, str, Sampler], dict], sample: Sampler) -> Any:
+    if isinstance(node, list):
+        return [_walk(v, context, visit, sample) for v in node]
+    if not isinstance(node, dict):
+        return node
+    out = {}
+    for key, value in node.items():
+        # the expressions of a plan node run on its input plan
+        inner = sample
+        if isinstance(value, dict) and isinstance(value.get("input"), dict):
+            plan = value["input"]
+            inner = _sampler(lambda plan=plan: pl.LazyFrame.from_json(json.dumps(plan)))
+        if key == "Window":
+            out[key] = _walk(value, "window", visit, inner)
+        elif key == "Aggregate":
+            out[key] = {k: _walk(v, "groupby" if k == "aggs" else context, visit, inner) for k, v in value.items()}
+        else:
+            out[key] = _walk(value, context, visit, inner)
+    return visit(out, context, sample) if "AnonymousFunction" in out else out
+
+
+def _scans(plan: Any) -> list[tuple[str, dict]]:
+    found = []
+    if isinstance(plan, dict):
+        for key, value in plan.items():
+            if key.endswith("Scan") and isinstance(value, dict):
+                found.append((key, value))
+            else:
+                found += _scans(value)
+    elif isinstance(plan, list):
+        for v in plan:
+            found += _scans(v)
+    return found
+
+
+def _in_memory_rows(plan: Any) -> int | None:
+    """Rows of the largest in-memory frame, if the plan reads no files."""
+    scans = _scans(plan)
+    if not scans or any(kind != "DataFrameScan" for kind, _ in scans):
+        return None
+    return max(len(s["df"]["columns"][0]["values"]) if s["df"]["columns"] else 0 for _, s in scans)
+
+
+def _process(plan: dict, registry: list, report: UdfReport) -> dict:
+    seen: set[int] = set()
+    out = _walk(plan, "select", lambda node, ctx, sample: _rewrite_node(node, ctx, registry, report, seen, sample), _sampler(None))
+    for i, function in enumerate(registry):
+        if i not in seen:
+            report.nodes.append(UdfNode("frame", "plan", _name(function)))
+    return out
+
+
+def _rewrite_args(value: Any, context: str, report: UdfReport, sample: Sampler) -> Any:
+    if isinstance(value, pl.Expr):
+        expr, sub = _rewrite_expr(value, context, sample)
+        report.nodes += sub.nodes
+        return expr
+    if isinstance(value, (list, tuple)):
+        return type(value)(_rewrite_args(v, context, report, sample) for v in value)
+    if isinstance(value, dict):
+        return {k: _rewrite_args(v, context, report, sample) for k, v in value.items()}
+    return value
+
+
+def _rewrite_tracked(query: batch.Tracked, report: UdfReport) -> batch.Tracked:
+    steps = []
+    for i, step in enumerate(query._steps):
+        context = "groupby" if step.method == batch._GROUPBY_AGG else "select"
+        # the step's input, as the query was given
+        sample = _sampler(batch.Tracked(query._source, query._steps[:i]).lazy)
+        steps.append(
+            replace(
+                step,
+                args=_rewrite_args(step.args, context, report, sample),
+                kwargs=_rewrite_args(step.kwargs, context, report, sample),
+            )
+        )
+    return batch.Tracked(query._source, tuple(steps))
+
+
+def rewrite(query: pl.LazyFrame | batch.Tracked, n_rows: int | None = None) -> tuple[pl.LazyFrame, UdfReport]:
+    """
+    Replace the UDFs in `query` that have native equivalents; returns the
+    new query and a report. Queries over in-memory frames must be built on
+    `batch.track(df)`: a DataFrame inside a plan doesn't survive the JSON
+    round trip exactly (NaN becomes null, some floats move by an ulp).
+    """
+    report = UdfReport(n_rows=n_rows)
+    if isinstance(query, batch.Tracked):
+        return _rewrite_tracked(query, report).lazy(), report
+
+    with capture() as registry:
+        plan = json.loads(query.write_json())
+        if any(kind == "DataFrameScan" for kind, _ in _scans(plan)):
+            raise ValueError("the query reads an in-memory DataFrame; build it on batch.track(df) to rewrite it")
+        rewritten = _process(plan, registry, report)
+        if not report.rewritten:
+            return query, report
+        return pl.LazyFrame.from_json(json.dumps(rewritten)), report
+
+
+def analyze(query: pl.LazyFrame | batch.Tracked, n_rows: int | None = None) -> UdfReport:
+    """What `rewrite` would do to `query`, without building the new query."""
+    if isinstance(query, batch.Tracked):
+        report = UdfReport(n_rows=n_rows)
+        _rewrite_tracked(query, report)
+        return report
+    with capture() as registry:
+        plan = json.loads(query.write_json())
+        report = UdfReport(n_rows=n_rows if n_rows is not None else _in_memory_rows(plan))
+        _process(plan, registry, report)
+    return report
+
+
+def _rewrite_expr(expr: pl.Expr, context: str, sample: Sampler) -> tuple[pl.Expr, UdfReport]:
+    report = UdfReport()
+    with capture() as registry:
+        tree = json.loads(expr.meta.write_json(None))
+        seen: set[int] = set()
+        rewritten = _walk(tree, context, lambda node, ctx, s: _rewrite_node(node, ctx, registry, report, seen, s), sample)
+        if not report.rewritten:
+            return expr, report
+        return pl.Expr.from_json(json.dumps(rewritten)), report
+
+
+def rewrite_expr(
+    expr: pl.Expr, frame: pl.DataFrame | pl.LazyFrame | None, context: str = "select"
+) -> tuple[pl.Expr, UdfReport]:
+    """
+    `rewrite` for a single expression over `frame`, used in a select (or
+    `context="groupby"`). Without a frame nothing can be checked and no
+    UDF is replaced.
+    """
+    return _rewrite_expr(expr, context, _sampler(frame.lazy if frame is not None else None))